@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+
+import sentry_sdk
+
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl.connections import connections
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def write_blocked(item):
+    # the bulk response entry of a write rejected because its partition is
+    # read-only: for a moment while manage_indices.py reindexes it, for
+    # good once it is frozen
+    result = next(iter(item.values()))
+    error = result.get('error')
+    return isinstance(error, dict) and \
+        error.get('type') == 'cluster_block_exception'
+
+
+def write_blocked_error(error):
+    # the same for the TransportError of a single write
+    return getattr(error, 'error', None) == 'cluster_block_exception'
+
+
+def bulk_write(client, actions, block_timeout, sleep=time.sleep,
+               clock=time.monotonic):
+    # (ok, item) per action like streaming_bulk, the actions rejected by a
+    # write block are sent again until block_timeout seconds passed
+    results = [None] * len(actions)
+    pending = list(range(len(actions)))
+    give_up_at = clock() + block_timeout
+
+    while pending:
+        retry = []
+        for position, (ok, item) in zip(pending, streaming_bulk(
+                client, [actions[position] for position in pending],
+                raise_on_error=False)):
+            results[position] = (ok, item)
+            if not ok and write_blocked(item) and clock() < give_up_at:
+                retry.append(position)
+
+        if retry:
+            sleep(1)
+        pending = retry
+
+    return results
+
+
+def unsent_item(action, error):
+    # a bulk response entry for an action the bulk request never answered
+    return {action.get('_op_type', 'index'): {
+        '_index': action.get('_index'), '_id': action.get('_id'),
+        'error': repr(error)}}
+
+
+def report_failure(item):
+    # item is the bulk response entry, like {'index': {'status': 400, ...}}
+    op_type, result = next(iter(item.items()))
+
+    if op_type == 'create' and result.get('status') == 409:
+        # an event delivered again after its redis claim expired, the
+        # document is written once but its points were counted again
+        logger.warning('activity %s already exists, its points were counted '
+                       'twice', result.get('_id'))
+        metrics.inc('duplicate_events_counted_total')
+        return
+
+    logger.error('failed to %s activity %s: %s', op_type, result.get('_id'),
+                 result.get('error'))
+
+    with sentry_sdk.push_scope() as scope:
+        scope.set_context('bulk_item', result)
+        sentry_sdk.capture_message(f'Failed to {op_type} wellness activity')
+
+
+class ActivityBuffer:
+    # Collects WellnessActivity documents and writes them with the bulk API
+    # once max_docs are buffered or max_delay seconds have passed, so a burst
+    # of reactions turns into a few bulk requests instead of one index
+    # request per reaction. Writes rejected by a write block, and the ones
+    # left unanswered by a failed bulk request, are kept and sent again with
+    # the next flushes for up to block_timeout seconds.
+
+    def __init__(self, max_docs=500, max_delay=1.0, using='default',
+                 on_failure=report_failure, block_timeout=60.0,
+                 clock=time.monotonic):
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.using = using
+        self.on_failure = on_failure
+        self.block_timeout = block_timeout
+        self._clock = clock
+
+        self._actions = []
+        # [(action, give_up_at)] of the writes to send again
+        self._retry = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._flush_periodically,
+                                            name='activity-buffer',
+                                            daemon=True)
+            self._thread.start()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.max_delay):
+            self.flush()
+
+    def add(self, activity, op_type='index'):
+        activity.prepare()
+        action = activity.to_dict(include_meta=True)
+        action['_op_type'] = op_type
+
+        self._start()
+        with self._lock:
+            self._actions.append(action)
+            full = len(self._actions) >= self.max_docs
+
+        if full:
+            self.flush()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._retry) + len(self._actions)
+
+    def flush(self):
+        with self._lock:
+            # the retried writes go first, they came in earlier
+            queued = self._retry + \
+                [(action, None) for action in self._actions]
+            self._retry, self._actions = [], []
+
+        if not queued:
+            return (0, 0)
+
+        written = failed = answered = 0
+        retry = []
+        # one flush at a time keeps the documents in the order they came in
+        with self._flush_lock, metrics.timer('es_bulk_seconds'):
+            now = self._clock()
+            try:
+                client = connections.get_connection(self.using)
+                for (action, give_up_at), (ok, item) in zip(
+                        queued, streaming_bulk(
+                            client, [action for action, _ in queued],
+                            chunk_size=self.max_docs, raise_on_error=False,
+                            raise_on_exception=False)):
+                    answered += 1
+                    if ok:
+                        written += 1
+                        continue
+
+                    if give_up_at is None:
+                        give_up_at = now + self.block_timeout
+                    if write_blocked(item) and now < give_up_at:
+                        retry.append((action, give_up_at))
+                    else:
+                        failed += 1
+                        self.on_failure(item)
+            except Exception as error:
+                # raise_on_exception=False only covers the transport, a
+                # document which cannot be serialized still ends up here.
+                # The points of these activities are counted already
+                logger.exception('bulk request failed after %s of %s '
+                                 'activities', answered, len(queued))
+                sentry_sdk.capture_exception(error)
+                for action, give_up_at in queued[answered:]:
+                    if give_up_at is None:
+                        give_up_at = now + self.block_timeout
+                    if now < give_up_at:
+                        retry.append((action, give_up_at))
+                    else:
+                        failed += 1
+                        self.on_failure(unsent_item(action, error))
+
+        if retry:
+            with self._lock:
+                self._retry = retry + self._retry
+            logger.warning('%s activities are kept to be sent again',
+                           len(retry))
+
+        metrics.inc('es_bulk_written_total', written)
+        metrics.inc('es_bulk_failed_total', failed)
+        logger.info('bulk wrote %s activities, %s failed', written, failed)
+        return (written, failed)
+
+    def close(self):
+        # flush-on-shutdown: stop the timer and write out what is left,
+        # waiting out a write block for as long as block_timeout allows
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        while self._retry:
+            time.sleep(1)
+            self.flush()
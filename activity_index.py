@@ -0,0 +1,73 @@
+import json
+
+from meta import LONG_ACTIVITIES_HASH
+
+# the delete modal lists the custom activities of 2 hours and more
+LONG_ACTIVITY_POINTS = 20
+
+# daily posts older than this are rarely edited, their index is rebuilt from
+# elasticsearch when they are
+ACTIVITY_INDEX_TTL = 30 * 24 * 60 * 60
+
+# field present once the index of a post was filled from elasticsearch,
+# before that it only holds the activities added since
+COMPLETE = '_complete'
+
+
+def index_key(channel_id, challenge_ts, user_name):
+    return f'{LONG_ACTIVITIES_HASH}:{channel_id}-{challenge_ts}-{user_name}'
+
+
+def activity_key(activity):
+    return index_key(activity.channel_id, activity.challenge_ts,
+                     activity.user_name)
+
+
+def entry(activity):
+    # what the modal needs to describe the activity, see human_str
+    return json.dumps({'activity': activity.activity,
+                       'category': activity.category,
+                       'points': activity.points,
+                       'reaction_ts': activity.reaction_ts})
+
+
+def add_activity(rds, activity):
+    # the activity needs its document id, assign it before saving
+    if activity.points < LONG_ACTIVITY_POINTS:
+        return
+
+    key = activity_key(activity)
+    with rds.pipeline() as pipe:
+        pipe.hset(key, activity.meta.id, entry(activity))
+        pipe.expire(key, ACTIVITY_INDEX_TTL)
+        pipe.execute()
+
+
+def remove_activities(rds, key, doc_ids):
+    if doc_ids:
+        rds.hdel(key, *doc_ids)
+
+
+def store_activities(rds, key, activities):
+    # merges the activities found in elasticsearch into the index and marks
+    # it complete, entries added meanwhile (and maybe not searchable yet)
+    # are kept
+    mapping = {activity.meta.id: entry(activity) for activity in activities}
+    mapping[COMPLETE] = '1'
+
+    with rds.pipeline() as pipe:
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, ACTIVITY_INDEX_TTL)
+        pipe.execute()
+
+
+def load_activities(rds, key):
+    # [(doc_id, fields)] of a complete index in the order the activities
+    # were reported, None when it has to be filled from elasticsearch first
+    entries = rds.hgetall(key)
+    if COMPLETE not in entries:
+        return None
+
+    activities = [(doc_id, json.loads(fields))
+                  for doc_id, fields in entries.items() if doc_id != COMPLETE]
+    return sorted(activities, key=lambda item: item[1]['reaction_ts'] or '')
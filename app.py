@@ -1,16 +1,24 @@
+import atexit
 import datetime
 
 import json
 import logging
 import os
 import pprint
+import signal
+import socket
+import sys
+import time
+import uuid
 
-from cachier import cachier
-from elasticsearch_dsl import Boolean, Document, Date, Integer, Keyword, Index, Q
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import ConflictError, TransportError
 from elasticsearch_dsl.connections import connections
 
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_sdk.errors import SlackApiError
 
 from dotenv import load_dotenv
 
@@ -19,18 +27,32 @@ import humanize
 import sentry_sdk
 from sentry_sdk.integrations.redis import RedisIntegration
 
-from wellness_redis import get_redis
+from activity_buffer import ActivityBuffer, bulk_write, write_blocked_error
+import activity_index
+import channel_resolver
+import leaderboard
+from event_dedupe import (claim_event, release_event, reaction_event_id,
+                          queue_event_counted, event_counted)
+from event_recorder import recording_middleware
+import metrics
+from reaction_coalescer import ReactionCoalescer
+from challenge_meta import ChallengeMemo, convert_slack_time, get_date_meta
+import models
+from models import (WellnessActivity, activity_hashes, activity_search,
+                    challenge_partition, setup_elastic)
+from slack_cache import TieredCache
+import slack_directory
+from slack_outbox import SlackOutbox
+import tracing
+from wellness_redis import get_redis, pool_stats
 from meta import (MetaConversion, BALANCE_CAP, REWARDS, MEGA_REWARDS, ALL_TOTALS_HASH,
                   USER_TOTALS_HASH, DAILY_TOTALS_HASH, DAILY_UNIQUE_HASH,
                   WEEKLY_USER_TOTALS_HASH, CUSTOM_DURATION_OPTIONS,
-                  CUSTOM_ACTIVITIES_OPTIONS, POINTS_TO_HUMAN_DURATIONS,
-                  CATEGORY_TO_DESCRIPTION)
+                  CUSTOM_ACTIVITIES_OPTIONS, METRICS_HASH)
 
 load_dotenv()
 
-sentry_sdk.init(
-    dsn=os.environ['SENTRY_TOKEN'],
-    traces_sample_rate=1.0,
+tracing.init_sentry(
     max_breadcrumbs=50,
     integrations=[
         RedisIntegration(),
@@ -42,95 +64,108 @@ logging.basicConfig(level=logging.INFO)
 SLACK_BOT_TOKEN = os.environ['SLACK_BOT_TOKEN']
 SLACK_APP_TOKEN = os.environ['SLACK_APP_TOKEN']
 
+# challenge channel of the slash commands sent from a DM or from a private
+# channel the bot is not a member of
+SLACK_POST_CHANNEL = os.environ.get('SLACK_POST_CHANNEL')
 
-app = App(token=SLACK_BOT_TOKEN)
-
-meta_conv = MetaConversion()
-
-
-def convert_slack_time(ts):
-    dt = datetime.datetime.fromtimestamp(float(ts))
-    return dt
-
-
-def get_date_meta(ts):
-    date = convert_slack_time(ts)
-    sun_week = int(date.strftime("%U"))
-    year, week, day = date.isocalendar()
-    return (date, year, sun_week, day)
-
-
-class WellnessActivity(Document):
-    channel = Keyword()
-    channel_id = Keyword()
-    activity = Keyword()
-    user = Keyword()
-    user_email = Keyword()
-
-    challenge_link = Keyword()
-
-    challenge_ts = Keyword()
-    challenge_date = Date()
-    challenge_year = Integer()
-    challenge_week = Integer()
-    challenge_day = Integer()
+# threads sending the DMs and channel updates triggered by the handlers
+SLACK_OUTBOX_WORKERS = int(os.environ.get('SLACK_OUTBOX_WORKERS', '4'))
 
-    category = Keyword()
-    reaction_ts = Keyword()
-    reaction_date = Date()
-    reaction_year = Integer()
-    reaction_week = Integer()
-    reaction_day = Integer()
+# seconds between full reconciles of the redis copy of the user directory
+SLACK_DIRECTORY_INTERVAL = float(os.environ.get('SLACK_DIRECTORY_INTERVAL',
+                                                str(6 * 60 * 60)))
 
-    reported_date = Date()
+# when set, activities are written with the bulk API once this many are
+# buffered or the interval (in seconds) passes. Off by default: a buffered
+# write is only checked by elasticsearch after its points were counted
+ES_BULK_SIZE = int(os.environ.get('ES_BULK_SIZE', '0'))
+ES_BULK_INTERVAL = float(os.environ.get('ES_BULK_INTERVAL', '1.0'))
 
-    points = Integer()
+# seconds a write rejected while its partition is write blocked (for the
+# catch-up copy of manage_indices.py reindex) is retried before it fails
+ES_WRITE_BLOCK_TIMEOUT = float(os.environ.get('ES_WRITE_BLOCK_TIMEOUT',
+                                              '60'))
 
-    deleted = Boolean()
+# seconds the reactions of a user on one post are held, so that toggling a
+# reaction on and off is saved and notified once; 0 processes every event
+REACTION_COALESCE_SECONDS = float(os.environ.get('REACTION_COALESCE_SECONDS',
+                                                '0'))
 
-    class Index:
-        name = os.environ['WELLNESS_INDEX']
-        settings = {
-          "number_of_shards": 2,
-        }
+# threads running the Bolt listeners, Bolt's own default is 5
+SLACK_LISTENER_WORKERS = int(os.environ.get('SLACK_LISTENER_WORKERS', '5'))
 
-    def save(self, ** kwargs):
-        self.channel = get_channel_name(self.channel_id)
-        (self.reaction_date, self.reaction_year, self.reaction_week,
-         self.reaction_day) = get_date_meta(self.reaction_ts)
-        (self.challenge_date, self.challenge_year, self.challenge_week,
-         self.challenge_day) = get_date_meta(self.challenge_ts)
+# when set, every incoming Slack request is appended to this JSONL file
+EVENT_RECORD_PATH = os.environ.get('EVENT_RECORD_PATH')
 
-        ts_encoding = str(int(float(self.challenge_ts)*1000000))
-        self.challenge_link = '{}archives/{}/p{}'.format(get_workspace_url(),
-                                                         self.channel_id,
-                                                         ts_encoding)
+# port of the prometheus /metrics endpoint, not served when unset
+METRICS_PORT = os.environ.get('METRICS_PORT')
+# seconds between snapshots of the metrics in redis, 0 disables them
+METRICS_PUBLISH_INTERVAL = float(os.environ.get('METRICS_PUBLISH_INTERVAL',
+                                                '60'))
 
-        if self.deleted is None:
-            self.deleted = False
+# users listed by /leaderboard
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', '10'))
 
-        return super(WellnessActivity, self).save(** kwargs)
+listener_executor = ThreadPoolExecutor(max_workers=SLACK_LISTENER_WORKERS,
+                                       thread_name_prefix='bolt-listener')
+app = App(token=SLACK_BOT_TOKEN, listener_executor=listener_executor)
 
-    def is_reported(self):
-        return datetime.datetime.utcnow() >= self.reported_date
+app.use(metrics.count_requests)
 
-    def human_str(self):
-        human_duration = POINTS_TO_HUMAN_DURATIONS[abs(self.points)]
-        human_descr = CATEGORY_TO_DESCRIPTION[self.category]
-        descr = f":{self.activity}: {human_descr} for {human_duration} ({self.points} points)"
-        return descr
+if EVENT_RECORD_PATH:
+    event_recorder = recording_middleware(EVENT_RECORD_PATH)
+    app.use(event_recorder)
+else:
+    event_recorder = None
 
+outbox = SlackOutbox(app.client, workers=SLACK_OUTBOX_WORKERS)
 
-def setup_elastic(elastic_host):
-    es_logger = logging.getLogger('elasticsearch')
-    es_logger.setLevel(logging.WARNING)
+if ES_BULK_SIZE > 0:
+    activity_buffer = ActivityBuffer(max_docs=ES_BULK_SIZE,
+                                     max_delay=ES_BULK_INTERVAL,
+                                     block_timeout=ES_WRITE_BLOCK_TIMEOUT)
+else:
+    activity_buffer = None
 
-    connections.create_connection(hosts=[elastic_host])
+metrics.gauge('slack_outbox_queue', outbox.qsize)
+# requests acked but still waiting for a listener thread
+metrics.gauge('listener_queue', listener_executor._work_queue.qsize)
+if activity_buffer is not None:
+    metrics.gauge('activity_buffer_docs', activity_buffer.__len__)
 
-    index = Index(os.environ['WELLNESS_INDEX'])
+meta_conv = MetaConversion()
 
-    # create the mappings in elasticsearch
-    WellnessActivity.init()
+# slack metadata lookups, kept in process and shared through redis
+SLACK_CACHE_TTL = datetime.timedelta(weeks=1).total_seconds()
+user_cache = TieredCache('slack_user', ttl=SLACK_CACHE_TTL)
+channel_cache = TieredCache('slack_channel', ttl=SLACK_CACHE_TTL)
+auth_cache = TieredCache('slack_auth', ttl=SLACK_CACHE_TTL)
+
+
+@metrics.timed('es_save_seconds')
+def save_activity(activity, op_type='index'):
+    # returns False when op_type='create' finds the document already written
+    with sentry_sdk.start_span(op='es.save', description=op_type):
+        if activity_buffer is not None:
+            # elasticsearch only sees the create when the buffer is flushed,
+            # after the points are counted: with ES_BULK_SIZE set the redis
+            # claim of the event (claim_event) is the only duplicate guard
+            activity_buffer.add(activity, op_type=op_type)
+            return True
+
+        give_up_at = time.monotonic() + ES_WRITE_BLOCK_TIMEOUT
+        while True:
+            try:
+                activity.save(op_type=op_type)
+            except ConflictError:
+                return False
+            except TransportError as error:
+                if not write_blocked_error(error) or \
+                        time.monotonic() >= give_up_at:
+                    raise
+                time.sleep(1)
+                continue
+            return True
 
 
 @app.event("app_mention")
@@ -141,6 +176,7 @@ def mention_handler(body, say, logger):
     pong = rds.ping()
     logger.warning('Redis PING: %s', pong)
     say(f'redis ping:{pong}')
+    say(f'redis pool: {pool_stats()}')
 
     es_health = connections.get_connection().cluster.health()
     logger.warning('ES health: %s', es_health)
@@ -183,7 +219,6 @@ def mention_handler(body, say, logger):
 #                 timestamp=body["event"]["event_ts"],
 #             )
 
-@cachier(stale_after=datetime.timedelta(weeks=1))
 def get_cached_user_data(user):
     # Returs something like this:
     # {'ok': True,
@@ -231,13 +266,19 @@ def get_cached_user_data(user):
     #           'updated': 1653872095,
     #           'who_can_share_contact_card': 'EVERYONE'}}
 
-    return app.client.users_info(user=user).data
+    def load():
+        with sentry_sdk.start_span(op='slack.api', description='users.info'):
+            return app.client.users_info(user=user).data
+
+    return user_cache.get(user, load)
 
 
 @app.event("member_joined_channel")
 def member_joined(event):
     pprint.pprint(event)
 
+    slack_directory.add_member(get_redis(), event['channel'], event['user'])
+
     dm_channel_id = event['user']
 
     app.client.chat_postMessage(
@@ -250,8 +291,10 @@ def member_joined(event):
 def handle_member_left_channel_events(body, logger):
     logger.info(body)
 
+    event = body['event']
+    slack_directory.remove_member(get_redis(), event['channel'], event['user'])
+
 
-@cachier(stale_after=datetime.timedelta(weeks=1))
 def channel_names():
     cursor = None
     channels = []
@@ -270,14 +313,16 @@ def channel_names():
 
 
 def get_channel_name(channel_id):
-    channel_mapping = channel_names()
-    return channel_mapping[channel_id]
+    def load():
+        with sentry_sdk.start_span(op='slack.api',
+                                   description='conversations.info'):
+            channel_info = app.client.conversations_info(channel=channel_id)
+        return channel_info['channel']['name']
 
+    return channel_cache.get(channel_id, load)
 
-@cachier()
-def get_auth():
-    auth = app.client.auth_test()
 
+def get_auth():
     # {
     #     "ok": true,
     #     "url": "https://subarachnoid.slack.com/",
@@ -287,23 +332,61 @@ def get_auth():
     #     "user_id": "W12345678"
     # }
 
-    return auth
+    return auth_cache.get('auth', lambda: app.client.auth_test().data)
 
 
-@cachier()
 def get_bot_id():
     return get_auth()['user_id']
 
 
-@cachier()
 def get_workspace_url():
     return get_auth()['url']
 
 
+challenge_memo = ChallengeMemo(get_channel_name, get_workspace_url)
+models.set_challenge_memo(challenge_memo)
+
+
+def warm_slack_caches():
+    # bulk load users and channels on startup, so the handlers do not have to
+    # call users_info/conversations_info for everybody during the first burst
+    cursor = None
+    while True:
+        user_list = app.client.users_list(cursor=cursor, limit=200)
+        user_cache.set_many({user['id']: {'ok': True, 'user': user}
+                             for user in user_list.data['members']})
+        cursor = user_list['response_metadata']['next_cursor']
+        if cursor == '':
+            break
+
+    channel_cache.set_many(channel_names())
+    get_auth()
+
+
+@app.event("user_change")
+@app.event("team_join")
+def handle_user_change(event, logger):
+    user_cache.invalidate(event['user']['id'])
+    slack_directory.store_user(get_redis(), event['user'])
+
+
+@app.event("channel_rename")
+def handle_channel_rename(event, logger):
+    channel_cache.invalidate(event['channel']['id'])
+    challenge_memo.invalidate_channel(event['channel']['id'])
+    channel_resolver.store_channel(get_redis(), event['channel'])
+
+
+@app.event("channel_created")
+def handle_channel_created(event, logger):
+    channel_resolver.store_channel(get_redis(), event['channel'])
+
+
 def get_reaction_icon(reaction):
     return reaction.split('::')[0]
 
 
+@metrics.timed('user_lookup_seconds')
 def get_username_email(slack_user_id):
     user_info = get_cached_user_data(slack_user_id)
 
@@ -314,9 +397,7 @@ def get_username_email(slack_user_id):
     return (user_name, user_email)
 
 
-@app.event("reaction_added")
-@app.event("reaction_removed")
-def reaction_added(event, say, logger):
+def reaction_activity(event):
     # Events looks like this:
     # {'event_ts': '1654995237.000100',
     #  'item': {'channel': 'C03HW2QP3QF',
@@ -329,7 +410,7 @@ def reaction_added(event, say, logger):
 
     # If this is a reaction to a non-bot owned message, we don't care
     if get_bot_id() != event['item_user']:
-        return
+        return None
 
     reaction = event['reaction']
 
@@ -337,15 +418,11 @@ def reaction_added(event, say, logger):
     icon = get_reaction_icon(reaction)
 
     if icon not in meta_conv.valid_reactions:
-        return
-
-    logger.debug(pprint.pformat(event))
+        return None
 
     slack_user_id = event['user']
     user_name,  user_email = get_username_email(slack_user_id)
 
-    logger.debug('%s reaction from %s (%s)', reaction, user_name, user_email)
-
     channel_id = event['item']['channel']
     challenge_ts = event['item']['ts']
     reaction_ts = event['event_ts']
@@ -372,59 +449,145 @@ def reaction_added(event, say, logger):
         points=points,
         deleted=deleted
     )
+    # retries of the event map to the same document
+    activity.meta.id = reaction_event_id(event)
 
-    activity.save()
+    return (activity, description)
+
+
+@app.event("reaction_added")
+@app.event("reaction_removed")
+@tracing.transaction('reaction_added')
+def reaction_added(event, say, logger):
+    parsed = reaction_activity(event)
+    if parsed is None:
+        return
+
+    activity, description = parsed
+
+    logger.debug(pprint.pformat(event))
+
+    # slack retries events which were not acked in time, only the first
+    # delivery is counted
+    rds = get_redis()
+    if not claim_event(rds, activity.meta.id):
+        logger.info('skipping retried %s %s', event['type'], activity.meta.id)
+        metrics.inc('duplicate_events_total')
+        return
+
+    if reaction_coalescer is not None:
+        key = (event['user'], activity.channel_id, activity.challenge_ts,
+               event['reaction'])
+        reaction_coalescer.add(key, activity, (event, description, logger))
+        return
+
+    try:
+        process_reaction(event, activity, description, logger)
+    except Exception:
+        release_uncounted_event(rds, activity.meta.id)
+        raise
+
+
+def release_uncounted_event(rds, event_id):
+    # a retry of an event which failed before its points were counted
+    # processes it again, once counted the retries are skipped
+    if not event_counted(rds, event_id):
+        release_event(rds, event_id)
+
+
+@tracing.transaction('reaction_coalesced')
+def commit_coalesced_reaction(activity, payload):
+    (event, description, logger) = payload
+    process_reaction(event, activity, description, logger)
+
+
+def release_coalesced_reactions(activity, items):
+    # the events folded into a net change which failed before it was
+    # counted are processed again when slack delivers them again
+    rds = get_redis()
+    if event_counted(rds, activity.meta.id):
+        return
+    for item_activity, _ in items:
+        release_event(rds, item_activity.meta.id)
+
+
+if REACTION_COALESCE_SECONDS > 0:
+    reaction_coalescer = ReactionCoalescer(
+        REACTION_COALESCE_SECONDS, commit_coalesced_reaction,
+        on_failure=release_coalesced_reactions)
+    metrics.gauge('reaction_coalescer_pending', reaction_coalescer.__len__)
+else:
+    reaction_coalescer = None
+
+
+def close_background_components():
+    # Lets the running listeners finish, then commits the reactions still
+    # held and writes and sends what is left in the buffer and the outbox,
+    # in that order since each one feeds the next. The event recording is
+    # closed last.
+    listener_executor.shutdown(wait=True)
+    if reaction_coalescer is not None:
+        reaction_coalescer.close()
+    if activity_buffer is not None:
+        activity_buffer.close()
+    outbox.stop()
+    if event_recorder is not None:
+        event_recorder.close()
+
+
+atexit.register(close_background_components)
+
+
+def process_reaction(event, activity, description, logger):
+    slack_user_id = event['user']
+    reaction = event['reaction']
+
+    logger.debug('%s reaction from %s (%s)', reaction, activity.user_name,
+                 activity.user_email)
+
+    if not save_activity(activity, op_type='create'):
+        # written by an earlier delivery, which may have failed before it
+        # counted the points
+        if event_counted(get_redis(), activity.meta.id):
+            logger.info('activity %s is already recorded', activity.meta.id)
+            return
+        logger.info('activity %s was recorded but not counted',
+                    activity.meta.id)
 
     (user_before_balance, user_balance, after_balance) = register_activity(
-        activity, slack_user_id, description, logger)
+        activity, slack_user_id, description, logger,
+        event_id=activity.meta.id)
 
     post_reward_update(user_before_balance, user_balance, slack_user_id,
-                       channel_id)
+                       activity.channel_id)
 
-    post_dm_update(points, after_balance, user_balance, activity,
+    post_dm_update(activity.points, after_balance, user_balance, activity,
                    slack_user_id, reaction, description)
 
 
-def register_activity(activity, slack_user_id, description, logger):
+def queue_activity_updates(pipe, activity):
+    # queues the balance updates on a (sync or asyncio) redis pipeline,
+    # read the results back with balances_from_results
+    (total_activity_hash, daily_activity_hash, user_activity_hash,
+     weekly_user_activity_hash) = activity_hashes(activity)
 
     points = activity.points
 
-    # Get totals
-    rds = get_redis()
+    pipe.hget(WEEKLY_USER_TOTALS_HASH, weekly_user_activity_hash)\
+        .hincrby(WEEKLY_USER_TOTALS_HASH, weekly_user_activity_hash,
+                 points)\
+        .pfadd(daily_activity_hash, activity.user_name)\
+        .hincrby(DAILY_TOTALS_HASH, daily_activity_hash, points)\
+        .hget(USER_TOTALS_HASH, user_activity_hash)\
+        .hincrby(USER_TOTALS_HASH, user_activity_hash, points)\
+        .hincrby(ALL_TOTALS_HASH, total_activity_hash, points)
+
+    return leaderboard.queue_updates(pipe, activity)
 
-    total_activity_hash = '{}'.format(activity.channel)
-
-    # daily balance for all users
-    # it is useful when you say "Yesterday we all made XXX points"
-    daily_activity_hash = '{}-{}-{}-{}'.format(activity.channel,
-                                               activity.challenge_year,
-                                               activity.challenge_week,
-                                               activity.challenge_day)
-
-    logger.warning('daily_hash: %s', daily_activity_hash)
-
-    # total balance for each user
-    # Used when user asks how much he contributed total
-    user_activity_hash = '{}-{}'.format(activity.channel,
-                                        activity.user_name)
-
-    # weekly balance for each user
-    # used to tell the user whenthey reached balance_cap
-    weekly_user_activity_hash = '{}-{}-{}-{}'.format(activity.channel,
-                                                     activity.challenge_year,
-                                                     activity.challenge_week,
-                                                     activity.user_name)
-    with rds.pipeline() as pipe:
-        pipe.hget(WEEKLY_USER_TOTALS_HASH, weekly_user_activity_hash)\
-            .hincrby(WEEKLY_USER_TOTALS_HASH, weekly_user_activity_hash,
-                     points)\
-            .pfadd(daily_activity_hash, activity.user_name)\
-            .hincrby(DAILY_TOTALS_HASH, daily_activity_hash, points)\
-            .hget(USER_TOTALS_HASH, user_activity_hash)\
-            .hincrby(USER_TOTALS_HASH, user_activity_hash, points)\
-            .hincrby(ALL_TOTALS_HASH, total_activity_hash, points)
-        (before_balance, after_balance, unique_status, daily_balance,
-         user_before_balance, user_balance, total) = pipe.execute()
+
+def balances_from_results(activity, results, logger):
+    (before_balance, after_balance, unique_status, daily_balance,
+     user_before_balance, user_balance, total) = results[:7]
 
     logger.warning('%s: before=%s, after=%s, daily=%s, '
                    'user_total=%s, total=%s',
@@ -446,43 +609,99 @@ def register_activity(activity, slack_user_id, description, logger):
     else:
         user_balance = int(user_balance)
 
-    if before_balance < BALANCE_CAP and after_balance >= BALANCE_CAP:
-        app.client.chat_postMessage(
-            channel=slack_user_id,
-            text=':tada: Congratulations on topping out the maximum weekly '
-            f'wellness contribution of {BALANCE_CAP} points!\n _Feel free to '
-            ' go above the limit if it helps you to track your '
-            'wellness goals: we do not mind at all. However, Intuitive Foundation'
-            f' matches only up to {BALANCE_CAP} points weekly._')
+    return (before_balance, after_balance, user_before_balance, user_balance)
 
-        app.client.chat_postMessage(
-            channel=activity.channel_id,
-            text=f':tada: <@{slack_user_id}> reached a weekly '
-            f'maximum weekly goal of {BALANCE_CAP} points!')
 
-    logger.warning('%s=%s', weekly_user_activity_hash, after_balance)
+def balance_cap_messages(before_balance, after_balance, slack_user_id,
+                         channel_id):
+    if not (before_balance < BALANCE_CAP and after_balance >= BALANCE_CAP):
+        return []
 
-    return (user_before_balance, user_balance, after_balance)
+    return [
+        dict(channel=slack_user_id,
+             text=':tada: Congratulations on topping out the maximum weekly '
+             f'wellness contribution of {BALANCE_CAP} points!\n _Feel free to '
+             ' go above the limit if it helps you to track your '
+             'wellness goals: we do not mind at all. However, Intuitive Foundation'
+             f' matches only up to {BALANCE_CAP} points weekly._'),
+        dict(channel=channel_id,
+             text=f':tada: <@{slack_user_id}> reached a weekly '
+             f'maximum weekly goal of {BALANCE_CAP} points!'),
+    ]
 
 
-def post_reward_update(user_before_balance, user_balance, slack_user_id,
-                       channel_id):
+# queue_activity_updates queues this many commands per activity
+ACTIVITY_UPDATE_RESULTS = 9
+
+
+def register_activities(activities, slack_user_id, logger, event_ids=()):
+    # applies the activities to the balances in one pipeline, returns
+    # (user_before_balance, user_balance, after_balance) of each of them.
+    # The slack events in event_ids are marked counted in the same
+    # transaction
+    rds = get_redis()
+
+    with rds.pipeline() as pipe, metrics.timer('redis_pipeline_seconds'), \
+            sentry_sdk.start_span(op='redis.pipeline',
+                                  description='register_activity'):
+        for activity in activities:
+            queue_activity_updates(pipe, activity)
+        for event_id in event_ids:
+            queue_event_counted(pipe, event_id)
+        results = pipe.execute()
+
+    balances = []
+    for position, activity in enumerate(activities):
+        start = position * ACTIVITY_UPDATE_RESULTS
+        (before_balance, after_balance, user_before_balance,
+         user_balance) = balances_from_results(
+             activity, results[start:start + ACTIVITY_UPDATE_RESULTS], logger)
+
+        for message in balance_cap_messages(before_balance, after_balance,
+                                            slack_user_id,
+                                            activity.channel_id):
+            outbox.chat_postMessage(**message)
+
+        balances.append((user_before_balance, user_balance, after_balance))
+
+    return balances
+
+
+def register_activity(activity, slack_user_id, description, logger,
+                      event_id=None):
+    event_ids = () if event_id is None else (event_id,)
+    return register_activities([activity], slack_user_id, logger,
+                               event_ids)[0]
+
+
+def reward_messages(user_before_balance, user_balance, slack_user_id,
+                    channel_id):
+    messages = []
     for reward in REWARDS:
         threshold = reward.cost
         if user_before_balance < threshold and user_balance >= threshold:
-            app.client.chat_postMessage(
+            messages.append(dict(
                 channel=slack_user_id,
                 text=f':tada: You have a :{reward.reaction}: reward: '
-                f'{reward.description}. Thank you so much!')
+                f'{reward.description}. Thank you so much!'))
 
-            app.client.chat_postMessage(
+            messages.append(dict(
                 channel=channel_id,
                 text=f':tada: <@{slack_user_id}> just earned :{reward.reaction}: '
-                f'badge @{reward.cost} points: {reward.description}')
+                f'badge @{reward.cost} points: {reward.description}'))
 
+    return messages
+
+
+def post_reward_update(user_before_balance, user_balance, slack_user_id,
+                       channel_id):
+    for message in reward_messages(user_before_balance, user_balance,
+                                   slack_user_id, channel_id):
+        outbox.chat_postMessage(**message)
 
-def post_dm_update(points, after_balance, user_balance, activity,
-                   slack_user_id, reaction, description, category=False):
+
+def dm_update_message(points, after_balance, user_balance, activity,
+                      slack_user_id, reaction, description, category=False):
 
     if category:
         add_identifier = f'custom duration {description.lower()} entry'
@@ -493,7 +712,7 @@ def post_dm_update(points, after_balance, user_balance, activity,
 
     parent_url = activity.challenge_link
     if points > 0:
-        app.client.chat_postMessage(
+        return dict(
             channel=slack_user_id,
             text=f'{points:+} points for {add_identifier} '
             f'<{parent_url}|here> '
@@ -502,13 +721,23 @@ def post_dm_update(points, after_balance, user_balance, activity,
             f'{user_balance} points).'
         )
     elif points < 0:
-        app.client.chat_postMessage(
+        return dict(
             channel=slack_user_id,
             text=f'adjusted {points:+} points for removing {remove_identifier} '
             f'<{parent_url}|here> '
             f'(your weekly balance is {after_balance} out of {BALANCE_CAP})'
         )
 
+    return None
+
+
+def post_dm_update(points, after_balance, user_balance, activity,
+                   slack_user_id, reaction, description, category=False):
+    message = dm_update_message(points, after_balance, user_balance, activity,
+                                slack_user_id, reaction, description, category)
+    if message is not None:
+        outbox.chat_postMessage(**message)
+
 
 @app.event("message")
 def handle_message_events(body, logger):
@@ -517,9 +746,126 @@ def handle_message_events(body, logger):
 
 
 
+def command_channel(channel_id):
+    # DMs have no name and the private channels the bot is not in cannot
+    # be looked up, those fall back to the challenge channel
+    try:
+        return get_channel_name(channel_id)
+    except (KeyError, SlackApiError):
+        logging.info('no name for channel %s, using %s', channel_id,
+                     SLACK_POST_CHANNEL)
+        return SLACK_POST_CHANNEL
+
+
+def command_usage(command):
+    return f'Please name the challenge channel, like `{command} #wellness`'
+
+
+def command_context(body):
+    # (channel, user_name, year, week) of a slash command: the challenge
+    # channel given as argument, by default the channel the command was
+    # sent from, and the current challenge week. channel is None when
+    # neither is known
+    channel = body.get('text', '').strip().lstrip('#') or \
+        command_channel(body['channel_id'])
+    user_name, _ = get_username_email(body['user_id'])
+    _, year, week, _ = get_date_meta(datetime.datetime.now().timestamp())
+    return channel, user_name, year, week
+
+
+def read_balances(rds, channel, year, week, user_name):
+    # (weekly balance, grand total, channel total) in one round trip
+    (total_activity_hash, _, user_activity_hash,
+     weekly_user_activity_hash) = activity_hashes(WellnessActivity(
+         channel=channel, challenge_year=year, challenge_week=week,
+         user_name=user_name))
+
+    with rds.pipeline(transaction=False) as pipe:
+        pipe.hget(WEEKLY_USER_TOTALS_HASH, weekly_user_activity_hash)\
+            .hget(USER_TOTALS_HASH, user_activity_hash)\
+            .hget(ALL_TOTALS_HASH, total_activity_hash)
+        balances = pipe.execute()
+
+    return tuple(int(balance or 0) for balance in balances)
+
+
+def next_reward(user_balance):
+    upcoming = [reward for reward in REWARDS if reward.cost > user_balance]
+    return min(upcoming, key=lambda reward: reward.cost, default=None)
+
+
+def balance_message(channel, weekly_balance, user_balance, channel_balance):
+    lines = [f'Your weekly balance in #{channel} is {weekly_balance} out of '
+             f'{BALANCE_CAP} points, grand total is {user_balance} points.']
+
+    reward = next_reward(user_balance)
+    if reward is not None:
+        lines.append(f'{reward.cost - user_balance} more points for the '
+                     f':{reward.reaction}: badge: {reward.description}.')
+
+    lines.append(f'Together #{channel} collected {channel_balance} points.')
+    return '\n'.join(lines)
+
+
 @app.command("/balance")
-def hello(body, ack):
-    ack(f"Hi <@{body['user_id']}> contibuted 10 coins!")
+@tracing.transaction('balance')
+def show_balance(ack, body):
+    ack(balance_reply(body))
+
+
+def balance_reply(body):
+    channel, user_name, year, week = command_context(body)
+    if channel is None:
+        return command_usage('/balance')
+
+    with sentry_sdk.start_span(op='redis.pipeline', description='balance'):
+        balances = read_balances(get_redis(), channel, year, week, user_name)
+
+    return balance_message(channel, *balances)
+
+
+def standing_lines(title, standing, user_name):
+    top, rank, points = standing
+    if not top:
+        return [f'*{title}*: no points yet']
+
+    lines = [f'*{title}*']
+    for position, (name, name_points) in enumerate(top, 1):
+        mark = ' :point_left:' if name == user_name else ''
+        lines.append(f'{position}. {name}: {name_points} points{mark}')
+
+    if rank is None:
+        lines.append('_you have no points yet_')
+    elif rank > len(top):
+        lines.append(f'_you are #{rank} with {points} points_')
+    return lines
+
+
+def leaderboard_message(channel, weekly, all_time, user_name):
+    return '\n'.join(
+        standing_lines(f'This week in #{channel}', weekly, user_name) +
+        [''] +
+        standing_lines(f'All time in #{channel}', all_time, user_name))
+
+
+@app.command("/leaderboard")
+@tracing.transaction('leaderboard')
+def show_leaderboard(ack, body):
+    ack(leaderboard_reply(body))
+
+
+def leaderboard_reply(body):
+    channel, user_name, year, week = command_context(body)
+    if channel is None:
+        return command_usage('/leaderboard')
+
+    with sentry_sdk.start_span(op='redis.pipeline',
+                               description='leaderboard'):
+        weekly, all_time = leaderboard.standings(
+            get_redis(), channel, year, week, user_name,
+            count=LEADERBOARD_SIZE)
+
+    return leaderboard_message(channel, weekly, all_time, user_name)
 
 
 @app.action("button-action")
@@ -543,14 +889,7 @@ def private_metadata_from_str(str_data):
 
 
 
-@app.shortcut("open_modal")
-@app.action("open_add_modal")
-def open_add_modal(ack, body, client, logger):
-    # Acknowledge the command request
-    ack()
-
-    logger.info(pprint.pformat(body))
-
+def modal_context(body):
     message_date = convert_slack_time(body['message']['ts'])
 
     display_date = humanize.naturaldate(message_date)
@@ -562,58 +901,77 @@ def open_add_modal(ack, body, client, logger):
     private_metadata = private_metadata_to_str(channel_id, message_ts,
                                                action_ts)
 
-    logger.info('private_metadata %s', private_metadata)
+    return (display_date, channel_id, message_ts, private_metadata)
 
-    # Call views_open with the built-in client
-    client.views_open(
-        # Pass a valid trigger_id within 3 seconds of receiving it
-        trigger_id=body["trigger_id"],
-        # View payload
-        view={
-            "type": "modal",
-            # View identifier
-            "callback_id": "view_add",
-            "title": {"type": "plain_text", "text": "Adding Custom Duration"},
-            "submit": {"type": "plain_text", "text": "Add"},
-            "private_metadata": private_metadata,
-            "blocks": [
-                {
-                    "type": "section",
-                    "block_id": "title_block_id",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"\n *Please select an activity to add for {display_date}"
-                    }
-                },
-                {
-                    "type": "actions",
-                    "block_id": "activity_block_id",
-                    "elements": [
-                        {
-                            "type": "static_select",
-                            "placeholder": {
-                                "type": "plain_text",
-                                "text": "What activity did you do?",
-                                "emoji": True
-                            },
-                            "options": CUSTOM_ACTIVITIES_OPTIONS,
-                            "action_id": "changed-activity"
+
+def add_modal_view(display_date, private_metadata):
+    return {
+        "type": "modal",
+        # View identifier
+        "callback_id": "view_add",
+        "title": {"type": "plain_text", "text": "Adding Custom Duration"},
+        "submit": {"type": "plain_text", "text": "Add"},
+        "private_metadata": private_metadata,
+        "blocks": [
+            {
+                "type": "section",
+                "block_id": "title_block_id",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"\n *Please select an activity to add for {display_date}"
+                }
+            },
+            {
+                "type": "actions",
+                "block_id": "activity_block_id",
+                "elements": [
+                    {
+                        "type": "static_select",
+                        "placeholder": {
+                            "type": "plain_text",
+                            "text": "What activity did you do?",
+                            "emoji": True
                         },
-                        {
-                            "type": "static_select",
-                            "placeholder": {
-                                "type": "plain_text",
-                                "text": "Duration",
-                                "emoji": True
-                            },
-                            "options": CUSTOM_DURATION_OPTIONS,
-                            "action_id": "changed-duration"
+                        "options": CUSTOM_ACTIVITIES_OPTIONS,
+                        "action_id": "changed-activity"
+                    },
+                    {
+                        "type": "static_select",
+                        "placeholder": {
+                            "type": "plain_text",
+                            "text": "Duration",
+                            "emoji": True
                         },
-                    ]
-                }
-            ]
-        }
-    )
+                        "options": CUSTOM_DURATION_OPTIONS,
+                        "action_id": "changed-duration"
+                    },
+                ]
+            }
+        ]
+    }
+
+
+@app.shortcut("open_modal")
+@app.action("open_add_modal")
+@tracing.transaction('open_add_modal')
+def open_add_modal(ack, body, client, logger):
+    # Acknowledge the command request
+    ack()
+
+    logger.info(pprint.pformat(body))
+
+    display_date, channel_id, message_ts, private_metadata = modal_context(body)
+
+    logger.info('private_metadata %s', private_metadata)
+
+    # Call views_open with the built-in client
+    with sentry_sdk.start_span(op='slack.api', description='views.open'):
+        client.views_open(
+            # Pass a valid trigger_id within 3 seconds of receiving it
+            trigger_id=body["trigger_id"],
+            # View payload
+            view=add_modal_view(display_date, private_metadata)
+        )
 
 
 @app.action("multi_static_select-action")
@@ -628,42 +986,61 @@ def handle_selected_option(ack, body, logger):
     logger.debug(body)
 
 
-@app.shortcut("open_modal")
-@app.action("open_edit_modal")
-def open_edit_modal(ack, body, client, logger):
-    # Acknowledge the command request
-    ack()
+def edit_modal_search(channel_id, message_ts, user_name):
+    # the partition is created by the first activity reported on the post
+    return activity_search(index=challenge_partition(message_ts),
+                           channel_id=channel_id, challenge_ts=message_ts,
+                           user_name=user_name, deleted=False)\
+        .params(ignore_unavailable=True)\
+        .filter('range', points={'gte': 20})
 
-    logger.info(pprint.pformat(body))
 
-    message_date = convert_slack_time(body['message']['ts'])
-
-    display_date = humanize.naturaldate(message_date)
-
-    action_ts = body['actions'][0]['action_ts']
-    channel_id = body['container']['channel_id']
-    message_ts = body['container']['message_ts']
+def indexed_activities(entries):
+    # the activities of the redis index, enough of them for human_str
+    return [WellnessActivity(meta={'id': doc_id}, **fields)
+            for doc_id, fields in entries]
 
-    user_name = body['user']['name']
 
-    private_metadata = private_metadata_to_str(channel_id, message_ts,
-                                               action_ts)
+def edit_modal_loading_view(display_date, private_metadata):
+    return {
+        "type": "modal",
+        "callback_id": "view_edit",
+        "title": {"type": "plain_text", "text": "Delete Custom Activity"},
+        "private_metadata": private_metadata,
+        "blocks": [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"Looking up your custom activities for {display_date}..."
+                }
+            }
+        ]
+    }
 
-    logger.info('private_metadata %s', private_metadata)
 
-    activity_search = WellnessActivity.search()
-    activity_search.query = Q('bool', must=[
-        Q('match', channel_id=channel_id),
-        Q('match', challenge_ts=message_ts),
-        Q('match', user_name=user_name),
-        Q('match', deleted=False)])
+def edit_modal_error_view(display_date, private_metadata):
+    return {
+        "type": "modal",
+        "callback_id": "view_edit",
+        "title": {"type": "plain_text", "text": "Delete Custom Activity"},
+        "private_metadata": private_metadata,
+        "blocks": [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"Sorry, could not look up your custom activities for {display_date}, please try again later"
+                }
+            }
+        ]
+    }
 
-    activities = activity_search.filter('range', points={'gte': 20}).execute()
 
+def edit_modal_view(display_date, private_metadata, activities):
     options = []
 
     for activity in activities:
-        logger.info("Found: %s", activity.human_str())
         options.append({
             "text": {
                 "type": "plain_text",
@@ -695,48 +1072,99 @@ def open_edit_modal(ack, body, client, logger):
             }
         ]
 
-        client.views_open(
-            # Pass a valid trigger_id within 3 seconds of receiving it
-            trigger_id=body["trigger_id"],
-            # View payload
-            view={
-                "type": "modal",
-                # View identifier
-                "callback_id": "view_edit",
-                "title": {"type": "plain_text", "text": "Delete Custom Activity"},
-                "submit": {"type": "plain_text", "text": "Delete"},
-                "private_metadata": private_metadata,
-                "blocks":  blocks
-            }
-        )
+        return {
+            "type": "modal",
+            # View identifier
+            "callback_id": "view_edit",
+            "title": {"type": "plain_text", "text": "Delete Custom Activity"},
+            "submit": {"type": "plain_text", "text": "Delete"},
+            "private_metadata": private_metadata,
+            "blocks":  blocks
+        }
 
-    else:
-        blocks = [
-            {
-                "type": "section",
-                "block_id": "title_block_id",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"Sorry, could not find custom activities (2 hours+) recorded {display_date}.\nNot seeing short activities? You can delete those by clicking your previous reactions."
-                }
+    blocks = [
+        {
+            "type": "section",
+            "block_id": "title_block_id",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"Sorry, could not find custom activities (2 hours+) recorded {display_date}.\nNot seeing short activities? You can delete those by clicking your previous reactions."
             }
-        ]
+        }
+    ]
 
-        client.views_open(
-            # Pass a valid trigger_id within 3 seconds of receiving it
+    return {
+        "type": "modal",
+        # View identifier
+        "callback_id": "view_edit",
+        "title": {"type": "plain_text", "text": "Delete Custom Activity"},
+        "private_metadata": private_metadata,
+        "blocks":  blocks
+    }
+
+
+@app.shortcut("open_modal")
+@app.action("open_edit_modal")
+@tracing.transaction('open_edit_modal')
+def open_edit_modal(ack, body, client, logger):
+    # Acknowledge the command request
+    ack()
+
+    logger.info(pprint.pformat(body))
+
+    display_date, channel_id, message_ts, private_metadata = modal_context(body)
+
+    user_name = body['user']['name']
+
+    logger.info('private_metadata %s', private_metadata)
+
+    rds = get_redis()
+    index_key = activity_index.index_key(channel_id, message_ts, user_name)
+
+    entries = activity_index.load_activities(rds, index_key)
+    if entries is not None:
+        with sentry_sdk.start_span(op='slack.api', description='views.open'):
+            client.views_open(
+                # Pass a valid trigger_id within 3 seconds of receiving it
+                trigger_id=body["trigger_id"],
+                # View payload
+                view=edit_modal_view(display_date, private_metadata,
+                                     indexed_activities(entries))
+            )
+        return
+
+    # the post is not indexed yet: open the modal before the trigger_id
+    # expires and fill it in once elasticsearch answered
+    with sentry_sdk.start_span(op='slack.api', description='views.open'):
+        response = client.views_open(
             trigger_id=body["trigger_id"],
-            # View payload
-            view={
-                "type": "modal",
-                # View identifier
-                "callback_id": "view_edit",
-                "title": {"type": "plain_text", "text": "Delete Custom Activity"},
-                "private_metadata": private_metadata,
-                "blocks":  blocks
-            }
+            view=edit_modal_loading_view(display_date, private_metadata)
         )
 
-
+    try:
+        with sentry_sdk.start_span(op='es.search', description='edit_modal'):
+            activities = edit_modal_search(channel_id, message_ts,
+                                           user_name).execute()
+
+        for activity in activities:
+            logger.info("Found: %s", activity.human_str())
+
+        activity_index.store_activities(rds, index_key, activities)
+        entries = activity_index.load_activities(rds, index_key)
+        view = edit_modal_view(display_date, private_metadata,
+                               indexed_activities(entries))
+    except Exception as error:
+        # do not leave the modal loading forever
+        logger.exception('failed to look up the activities of %s', index_key)
+        sentry_sdk.capture_exception(error)
+        view = edit_modal_error_view(display_date, private_metadata)
+
+    with sentry_sdk.start_span(op='slack.api', description='views.update'):
+        client.views_update(
+            view_id=response['view']['id'],
+            hash=response['view']['hash'],
+            view=view
+        )
 
     # Call views_open with the built-in client
     # client.views_open(
@@ -801,7 +1229,109 @@ def open_add_modal(ack, body, client, logger):
     logger.info(pprint.pformat(body))
 
 
+def selected_doc_ids(body):
+    docs = body['view']['state']['values']['selection']['multi_static_select-action']['selected_options']
+
+    doc_ids = []
+    for doc in docs:
+        doc_ids.append(doc['value'])
+
+    return doc_ids
+
+
+def negative_activity_for(record, reaction_ts):
+    assert record.points > 0
+    return WellnessActivity(
+        channel_id=record.channel_id,
+        activity=record.activity,
+        category=record.category,
+        user_name=record.user_name,
+        user_email=record.user_email,
+        challenge_ts=record.challenge_ts,
+        reaction_ts=reaction_ts,
+        points=-record.points,
+    )
+
+
+def deletable_records(records):
+    # documents already deleted and negative entries cannot be deleted
+    return [record for record in records
+            if not record.deleted and record.points > 0]
+
+
+def deleted_activity_id(record):
+    # the negative entry of a document has a fixed id, so when two deletions
+    # of the same document race only one of them can write it
+    return f'{record.meta.id}-deleted'
+
+
+def deletion_actions(record, negative_activity):
+    # bulk actions flagging the document deleted, unless it changed since it
+    # was read, and writing its negative entry
+    create = negative_activity.to_dict(include_meta=True)
+    create['_op_type'] = 'create'
+
+    return [
+        {'_op_type': 'update', '_index': record.meta.index,
+         '_id': record.meta.id, 'if_seq_no': record.meta.seq_no,
+         'if_primary_term': record.meta.primary_term,
+         'doc': {'deleted': True}},
+        create,
+    ]
+
+
+def deleted_from_results(deletions, results, logger):
+    # the (record, negative activity) deletions this request wrote the
+    # negative entry of, results are the (ok, item) of deletion_actions
+    # in order
+    results = iter(results)
+    deleted = []
+    for deletion, (flagged, _), (created, _) in zip(deletions, results,
+                                                      results):
+        record = deletion[0]
+        if not created:
+            logger.info('activity %s is already deleted', record.meta.id)
+            continue
+
+        if not flagged:
+            logger.warning('activity %s changed while it was deleted',
+                           record.meta.id)
+        deleted.append(deletion)
+
+    return deleted
+
+
+def group_deletions(deleted):
+    # one negative activity with the summed points per set of balances, with
+    # the records it removes
+    groups = {}
+    for record, negative_activity in deleted:
+        hashes = activity_hashes(negative_activity)
+        if hashes in groups:
+            groups[hashes][0].points += negative_activity.points
+            groups[hashes][1].append(record)
+        else:
+            total = WellnessActivity(**negative_activity.to_dict())
+            groups[hashes] = (total, [record])
+
+    return list(groups.values())
+
+
+def deleted_index_ids(deleted):
+    # {activity index key: [doc_id]} of the deleted records
+    index_ids = {}
+    for record, _ in deleted:
+        index_ids.setdefault(activity_index.activity_key(record),
+                             []).append(record.meta.id)
+    return index_ids
+
+
+def deletion_description(records):
+    return ', '.join(record.human_str() for record in records)
+
+
 @app.view("view_edit")
+@tracing.transaction('view_edit')
 def handle_edit_events(ack, body, logger):
     ack()
     logger.info(pprint.pformat(body))
@@ -811,56 +1341,54 @@ def handle_edit_events(ack, body, logger):
 
     channel_id, challenge_ts, reaction_ts = private_metadata_from_str(body['view']['private_metadata'])
 
-    docs = body['view']['state']['values']['selection']['multi_static_select-action']['selected_options']
-
-    doc_ids = []
-    for doc in docs:
-        doc_ids.append(doc['value'])
+    doc_ids = selected_doc_ids(body)
 
     logger.info('deleting %s', doc_ids)
 
-    # make sure user cannot delete document many times by tagging it as 'deleted=True'
-    for doc_id in doc_ids:
-        record = WellnessActivity.get(id=doc_id)
-        record.update(deleted=True)
-
-        assert record.points > 0
-        negative_activity = WellnessActivity(
-            channel_id=record.channel_id,
-            activity=record.activity,
-            category=record.category,
-            user_name=record.user_name,
-            user_email=record.user_email,
-            challenge_ts=record.challenge_ts,
-            reaction_ts=reaction_ts,
-            points=-record.points,
-        )
+    with sentry_sdk.start_span(op='es.mget', description='delete'):
+        records = WellnessActivity.mget(
+            doc_ids, index=challenge_partition(challenge_ts), missing='skip')
+
+    deletions = []
+    for record in deletable_records(records):
+        negative_activity = negative_activity_for(record, reaction_ts)
+        negative_activity.meta.id = deleted_activity_id(record)
+        negative_activity.prepare()
+        deletions.append((record, negative_activity))
 
-        negative_activity.save()
+    if not deletions:
+        return
 
-        description_with_hours = record.human_str()
+    # the deleted flag and the negative entries in one request, a document
+    # is deleted by the request which manages to create its negative entry
+    actions = [action for deletion in deletions
+               for action in deletion_actions(*deletion)]
+    with sentry_sdk.start_span(op='es.bulk', description='delete'):
+        results = bulk_write(connections.get_connection(), actions,
+                             ES_WRITE_BLOCK_TIMEOUT)
+        deleted = deleted_from_results(deletions, results, logger)
+
+    rds = get_redis()
+    for index_key, index_ids in deleted_index_ids(deleted).items():
+        activity_index.remove_activities(rds, index_key, index_ids)
 
-        (user_before_balance, user_balance, after_balance) = register_activity(
-            negative_activity, slack_user_id, description_with_hours, logger)
+    groups = group_deletions(deleted)
+    balances = register_activities([total for total, _ in groups],
+                                   slack_user_id, logger)
 
+    for (total, records), (user_before_balance, user_balance,
+                           after_balance) in zip(groups, balances):
         post_reward_update(user_before_balance, user_balance, slack_user_id,
                            channel_id)
 
-        category_icon = meta_conv.category_to_icon[negative_activity.category]
+        category_icon = meta_conv.category_to_icon[total.category]
 
-        post_dm_update(negative_activity.points, after_balance, user_balance,
-                       negative_activity,
+        post_dm_update(total.points, after_balance, user_balance, total,
                        slack_user_id, category_icon,
-                       description_with_hours, True)
+                       deletion_description(records), True)
 
 
-
-
-@app.view("view_add")
-def handle_add_events(ack, body, logger):
-    ack()
-    #logger.info(pprint.pformat(body))
-
+def add_activity_from_view(body):
     slack_user_id = body['user']['id']
     user_name,  user_email = get_username_email(slack_user_id)
 
@@ -874,8 +1402,6 @@ def handle_add_events(ack, body, logger):
 
     points = int(body['view']['state']['values']['activity_block_id']['changed-duration']['selected_option']['value'])
 
-    logger.debug('%s category from %s (%s) for %s points', category, user_name, user_email, points)
-
     category_icon = meta_conv.category_to_icon[category]
 
     activity = WellnessActivity(
@@ -888,18 +1414,37 @@ def handle_add_events(ack, body, logger):
         reaction_ts=reaction_ts,
         points=points,
     )
+    # known before the document is written, the delete modal lists it by id
+    activity.meta.id = uuid.uuid4().hex
 
-    activity.save()
+    return (activity, description_with_hours)
+
+
+@app.view("view_add")
+@tracing.transaction('view_add')
+def handle_add_events(ack, body, logger):
+    ack()
+    #logger.info(pprint.pformat(body))
+
+    slack_user_id = body['user']['id']
+
+    activity, description_with_hours = add_activity_from_view(body)
+
+    logger.debug('%s category from %s (%s) for %s points', activity.category,
+                 activity.user_name, activity.user_email, activity.points)
+
+    save_activity(activity)
+    activity_index.add_activity(get_redis(), activity)
 
     (user_before_balance, user_balance, after_balance) = register_activity(
         activity, slack_user_id, description_with_hours, logger)
 
     post_reward_update(user_before_balance, user_balance, slack_user_id,
-                       channel_id)
+                       activity.channel_id)
 
-    category_icon = meta_conv.category_to_icon[category]
+    category_icon = meta_conv.category_to_icon[activity.category]
 
-    post_dm_update(points, after_balance, user_balance, activity,
+    post_dm_update(activity.points, after_balance, user_balance, activity,
                    slack_user_id, category_icon, description_with_hours, True)
 
 
@@ -936,7 +1481,37 @@ def update_modal(ack, body, client):
         }
     )
 
+
+def exit_on_sigterm(handler):
+    # docker and systemd stop the bot with SIGTERM, which kills the process
+    # without running atexit. Exiting from the handler runs it.
+    def stop(signum, frame):
+        logging.info('stopping on signal %s', signum)
+        handler.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+
+
+class InstrumentedSocketModeHandler(SocketModeHandler):
+    # times every Socket Mode envelope from its arrival until it is acked
+    def handle(self, client, req):
+        with metrics.timer('slack_ack_seconds',
+                           type=metrics.request_type(req.payload)):
+            super().handle(client, req)
+
+
 if __name__ == "__main__":
     setup_elastic(os.environ['ELASTIC_HOST'])
-    handler = SocketModeHandler(app, SLACK_APP_TOKEN)
+    warm_slack_caches()
+    slack_directory.start_reconciler(get_redis, app.client,
+                                     SLACK_DIRECTORY_INTERVAL)
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT))
+    if METRICS_PUBLISH_INTERVAL > 0:
+        metrics.start_publisher(
+            get_redis, f'{METRICS_HASH}:{socket.gethostname()}-{os.getpid()}',
+            METRICS_PUBLISH_INTERVAL)
+    handler = InstrumentedSocketModeHandler(app, SLACK_APP_TOKEN)
+    exit_on_sigterm(handler)
     handler.start()
@@ -0,0 +1,440 @@
+import asyncio
+import logging
+import os
+import pprint
+import signal
+
+from elasticsearch import AsyncElasticsearch, ConflictError, TransportError
+from elasticsearch.helpers import async_streaming_bulk
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+import sentry_sdk
+
+import activity_index
+import slack_directory
+from activity_buffer import write_blocked, write_blocked_error
+from event_dedupe import (EVENT_DEDUPE_TTL, counted_key, processed_key,
+                          queue_event_counted)
+from wellness_redis import get_async_redis, get_redis
+
+# The handler logic (parsing of events and views, the redis schema, message
+# texts and modal views) is shared with the thread based bot in app.py, only
+# the I/O is done differently here.
+from app import (SLACK_BOT_TOKEN, SLACK_APP_TOKEN, WellnessActivity,
+                 challenge_partition, meta_conv, setup_elastic,
+                 warm_slack_caches, reaction_activity,
+                 add_activity_from_view, selected_doc_ids,
+                 negative_activity_for, private_metadata_from_str,
+                 deletable_records, deleted_activity_id, deletion_actions,
+                 deleted_from_results, deleted_index_ids, group_deletions,
+                 deletion_description, ACTIVITY_UPDATE_RESULTS,
+                 ES_WRITE_BLOCK_TIMEOUT,
+                 queue_activity_updates, balances_from_results,
+                 balance_cap_messages, reward_messages, dm_update_message,
+                 modal_context, add_modal_view, edit_modal_search,
+                 edit_modal_view, edit_modal_loading_view,
+                 edit_modal_error_view, balance_reply, leaderboard_reply,
+                 indexed_activities, handle_user_change,
+                 handle_channel_rename, handle_channel_created)
+
+
+app = AsyncApp(token=SLACK_BOT_TOKEN)
+
+logger = logging.getLogger(__name__)
+
+es = None
+
+
+async def index_activity(activity, op_type='index'):
+    # returns False when op_type='create' finds the document already written
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + ES_WRITE_BLOCK_TIMEOUT
+    while True:
+        try:
+            meta = await es.index(index=activity.meta.index,
+                                  body=activity.to_dict(),
+                                  id=activity.meta.id if 'id' in activity.meta else None,
+                                  op_type=op_type)
+        except ConflictError:
+            return False
+        except TransportError as error:
+            # the partition is write blocked for a reindex, wait it out
+            if not write_blocked_error(error) or loop.time() >= give_up_at:
+                raise
+            await asyncio.sleep(1)
+            continue
+        break
+
+    activity.meta.id = meta['_id']
+    return True
+
+
+async def bulk_write(actions):
+    # activity_buffer.bulk_write on the async client
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + ES_WRITE_BLOCK_TIMEOUT
+    results = [None] * len(actions)
+    pending = list(range(len(actions)))
+
+    while pending:
+        retry = []
+        position_iter = iter(pending)
+        async for ok, item in async_streaming_bulk(
+                es, [actions[position] for position in pending],
+                raise_on_error=False):
+            position = next(position_iter)
+            results[position] = (ok, item)
+            if not ok and write_blocked(item) and loop.time() < give_up_at:
+                retry.append(position)
+
+        if retry:
+            await asyncio.sleep(1)
+        pending = retry
+
+    return results
+
+
+async def register_activity(activity, logger, event_id=None):
+    rds = get_async_redis()
+
+    async with rds.pipeline() as pipe:
+        queue_activity_updates(pipe, activity)
+        # marks the slack event counted in the same transaction
+        if event_id is not None:
+            queue_event_counted(pipe, event_id)
+        results = await pipe.execute()
+
+    return balances_from_results(activity, results, logger)
+
+
+async def post_messages(messages):
+    # messages to the same channel keep their order, different channels
+    # (the user's DM and the challenge channel) are posted concurrently
+    by_channel = {}
+    for message in messages:
+        by_channel.setdefault(message['channel'], []).append(message)
+
+    async def post_in_order(channel_messages):
+        for message in channel_messages:
+            await app.client.chat_postMessage(**message)
+
+    await asyncio.gather(*(post_in_order(channel_messages)
+                           for channel_messages in by_channel.values()))
+
+
+async def process_activity(activity, slack_user_id, reaction, description,
+                           logger, category=False, op_type='index',
+                           event_id=None):
+    # derived fields may need a (cached) slack lookup, keep it off the loop
+    await asyncio.to_thread(activity.prepare)
+
+    # the create is the duplicate guard, so it is written before the points
+    # are counted
+    if not await index_activity(activity, op_type):
+        # written by an earlier delivery, which may have failed before it
+        # counted the points
+        if event_id is None or \
+                await get_async_redis().exists(counted_key(event_id)):
+            logger.info('activity %s is already recorded', activity.meta.id)
+            return
+        logger.info('activity %s was recorded but not counted',
+                    activity.meta.id)
+
+    (before_balance, after_balance, user_before_balance,
+     user_balance) = await register_activity(activity, logger, event_id)
+
+    messages = balance_cap_messages(before_balance, after_balance,
+                                    slack_user_id, activity.channel_id)
+    messages += reward_messages(user_before_balance, user_balance,
+                                slack_user_id, activity.channel_id)
+
+    dm_message = dm_update_message(activity.points, after_balance,
+                                   user_balance, activity, slack_user_id,
+                                   reaction, description, category)
+    if dm_message is not None:
+        messages.append(dm_message)
+
+    await post_messages(messages)
+
+
+@app.event("member_joined_channel")
+async def member_joined(event, client):
+    await asyncio.to_thread(slack_directory.add_member, get_redis(),
+                            event['channel'], event['user'])
+
+    await client.chat_postMessage(
+        channel=event['user'],
+        text='welcome to the challenge'
+    )
+
+
+@app.event("member_left_channel")
+async def handle_member_left_channel_events(body, logger):
+    logger.info(body)
+
+    event = body['event']
+    await asyncio.to_thread(slack_directory.remove_member, get_redis(),
+                            event['channel'], event['user'])
+
+
+# the caches and the redis directory are shared with app.py, so are the
+# listeners keeping them current
+@app.event("user_change")
+@app.event("team_join")
+async def user_changed(event, logger):
+    await asyncio.to_thread(handle_user_change, event, logger)
+
+
+@app.event("channel_rename")
+async def channel_renamed(event, logger):
+    await asyncio.to_thread(handle_channel_rename, event, logger)
+
+
+@app.event("channel_created")
+async def channel_created(event, logger):
+    await asyncio.to_thread(handle_channel_created, event, logger)
+
+
+@app.event("reaction_added")
+@app.event("reaction_removed")
+async def reaction_added(event, logger):
+    parsed = await asyncio.to_thread(reaction_activity, event)
+    if parsed is None:
+        return
+
+    activity, description = parsed
+
+    logger.debug(pprint.pformat(event))
+
+    # slack retries events which were not acked in time, only the first
+    # delivery is counted
+    rds = get_async_redis()
+    if not await rds.set(processed_key(activity.meta.id), 1, nx=True,
+                         ex=EVENT_DEDUPE_TTL):
+        logger.info('skipping retried %s %s', event['type'], activity.meta.id)
+        return
+
+    try:
+        await process_activity(activity, event['user'], event['reaction'],
+                               description, logger, op_type='create',
+                               event_id=activity.meta.id)
+    except Exception:
+        # once the points are counted the retries are skipped
+        if not await rds.exists(counted_key(activity.meta.id)):
+            await rds.delete(processed_key(activity.meta.id))
+        raise
+
+
+@app.view("view_add")
+async def handle_add_events(ack, body, logger):
+    await ack()
+
+    activity, description_with_hours = await asyncio.to_thread(
+        add_activity_from_view, body)
+
+    logger.debug('%s category from %s (%s) for %s points', activity.category,
+                 activity.user_name, activity.user_email, activity.points)
+
+    category_icon = meta_conv.category_to_icon[activity.category]
+
+    await asyncio.to_thread(activity_index.add_activity, get_redis(), activity)
+    await process_activity(activity, body['user']['id'], category_icon,
+                           description_with_hours, logger, True)
+
+
+@app.view("view_edit")
+async def handle_edit_events(ack, body, logger):
+    await ack()
+    logger.info(pprint.pformat(body))
+
+    slack_user_id = body['user']['id']
+
+    channel_id, challenge_ts, reaction_ts = private_metadata_from_str(body['view']['private_metadata'])
+
+    doc_ids = selected_doc_ids(body)
+
+    logger.info('deleting %s', doc_ids)
+
+    response = await es.mget(index=challenge_partition(challenge_ts),
+                             body={'ids': doc_ids})
+    records = deletable_records([WellnessActivity.from_es(doc)
+                                 for doc in response['docs'] if doc['found']])
+
+    deletions = []
+    for record in records:
+        negative_activity = negative_activity_for(record, reaction_ts)
+        negative_activity.meta.id = deleted_activity_id(record)
+        # derived fields may need a (cached) slack lookup, keep it off the loop
+        await asyncio.to_thread(negative_activity.prepare)
+        deletions.append((record, negative_activity))
+
+    if not deletions:
+        return
+
+    actions = [action for deletion in deletions
+               for action in deletion_actions(*deletion)]
+    results = await bulk_write(actions)
+    deleted = deleted_from_results(deletions, results, logger)
+
+    rds = get_redis()
+    for index_key, index_ids in deleted_index_ids(deleted).items():
+        await asyncio.to_thread(activity_index.remove_activities, rds,
+                                index_key, index_ids)
+
+    groups = group_deletions(deleted)
+
+    async with get_async_redis().pipeline() as pipe:
+        for total, _ in groups:
+            queue_activity_updates(pipe, total)
+        results = await pipe.execute()
+
+    messages = []
+    for position, (total, records) in enumerate(groups):
+        start = position * ACTIVITY_UPDATE_RESULTS
+        (before_balance, after_balance, user_before_balance,
+         user_balance) = balances_from_results(
+             total, results[start:start + ACTIVITY_UPDATE_RESULTS], logger)
+
+        messages += balance_cap_messages(before_balance, after_balance,
+                                         slack_user_id, total.channel_id)
+        messages += reward_messages(user_before_balance, user_balance,
+                                    slack_user_id, total.channel_id)
+
+        category_icon = meta_conv.category_to_icon[total.category]
+        dm_message = dm_update_message(total.points, after_balance,
+                                       user_balance, total, slack_user_id,
+                                       category_icon,
+                                       deletion_description(records), True)
+        if dm_message is not None:
+            messages.append(dm_message)
+
+    await post_messages(messages)
+
+
+@app.shortcut("open_modal")
+@app.action("open_add_modal")
+async def open_add_modal(ack, body, client, logger):
+    await ack()
+
+    display_date, channel_id, message_ts, private_metadata = modal_context(body)
+
+    logger.info('private_metadata %s', private_metadata)
+
+    await client.views_open(
+        # Pass a valid trigger_id within 3 seconds of receiving it
+        trigger_id=body["trigger_id"],
+        view=add_modal_view(display_date, private_metadata)
+    )
+
+
+@app.shortcut("open_modal")
+@app.action("open_edit_modal")
+async def open_edit_modal(ack, body, client, logger):
+    await ack()
+
+    display_date, channel_id, message_ts, private_metadata = modal_context(body)
+
+    user_name = body['user']['name']
+
+    logger.info('private_metadata %s', private_metadata)
+
+    rds = get_redis()
+    index_key = activity_index.index_key(channel_id, message_ts, user_name)
+
+    entries = await asyncio.to_thread(activity_index.load_activities, rds,
+                                      index_key)
+    if entries is not None:
+        await client.views_open(
+            # Pass a valid trigger_id within 3 seconds of receiving it
+            trigger_id=body["trigger_id"],
+            view=edit_modal_view(display_date, private_metadata,
+                                 indexed_activities(entries))
+        )
+        return
+
+    # the post is not indexed yet: open the modal before the trigger_id
+    # expires and fill it in once elasticsearch answered
+    opened = await client.views_open(
+        trigger_id=body["trigger_id"],
+        view=edit_modal_loading_view(display_date, private_metadata)
+    )
+
+    try:
+        activity_search = edit_modal_search(channel_id, message_ts, user_name)
+        response = await es.search(index=challenge_partition(message_ts),
+                                   body=activity_search.to_dict(),
+                                   ignore_unavailable=True)
+
+        activities = [WellnessActivity.from_es(hit)
+                      for hit in response['hits']['hits']]
+
+        await asyncio.to_thread(activity_index.store_activities, rds,
+                                index_key, activities)
+        entries = await asyncio.to_thread(activity_index.load_activities, rds,
+                                          index_key)
+        view = edit_modal_view(display_date, private_metadata,
+                               indexed_activities(entries))
+    except Exception as error:
+        # do not leave the modal loading forever
+        logger.exception('failed to look up the activities of %s', index_key)
+        sentry_sdk.capture_exception(error)
+        view = edit_modal_error_view(display_date, private_metadata)
+
+    await client.views_update(
+        view_id=opened['view']['id'],
+        hash=opened['view']['hash'],
+        view=view
+    )
+
+
+@app.command("/balance")
+async def show_balance(ack, body):
+    # the redis reads and the channel lookup use the clients of app.py
+    await ack(await asyncio.to_thread(balance_reply, body))
+
+
+@app.command("/leaderboard")
+async def show_leaderboard(ack, body):
+    await ack(await asyncio.to_thread(leaderboard_reply, body))
+
+
+@app.action("changed-activity")
+@app.action("changed-duration")
+@app.action("multi_static_select-action")
+async def handle_modal_selection(ack):
+    await ack()
+
+
+@app.event("message")
+async def handle_message_events():
+    return
+
+
+async def main():
+    global es
+
+    # mappings are still created with the blocking client on startup
+    setup_elastic(os.environ['ELASTIC_HOST'])
+    warm_slack_caches()
+    es = AsyncElasticsearch(hosts=[os.environ['ELASTIC_HOST']])
+
+    handler = AsyncSocketModeHandler(app, SLACK_APP_TOKEN)
+
+    # docker and systemd stop the bot with SIGTERM, which would skip the
+    # cleanup below and atexit
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel)
+
+    try:
+        await handler.start_async()
+    except asyncio.CancelledError:
+        logger.info('stopping on SIGTERM')
+    finally:
+        await handler.close_async()
+        await es.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
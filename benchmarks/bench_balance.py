@@ -0,0 +1,85 @@
+# Latency of the /balance command against fakeredis holding the balances of
+# a growing number of users, to check that it does not depend on it.
+#
+#   python -m benchmarks.bench_balance
+#   python -m benchmarks.bench_balance --users 1000 100000 --requests 2000
+#
+# For every user count it prints the p50/p95/p99 (in ms) of the whole
+# command, from the request to its ack, and of the redis read.
+
+import argparse
+import logging
+import random
+import time
+
+from meta import ALL_TOTALS_HASH, USER_TOTALS_HASH, WEEKLY_USER_TOTALS_HASH
+
+from benchmarks.bench_handlers import (CHANNEL_ID, StageTimer,
+                                       print_percentiles)
+from benchmarks.standins import SlackStub, load_app
+
+CHANNEL = 'wellness'
+
+# users answered by the stubbed users.info, they are in the slack cache
+# after the first command
+CALLERS = 50
+
+
+def seed_balances(app, users, year, week):
+    # balances of `users` users with the callers among them
+    rds = app.get_redis()
+    rds.flushall()
+
+    batch = 10000
+    for start in range(0, users, batch):
+        numbers = range(start, min(start + batch, users))
+        with rds.pipeline(transaction=False) as pipe:
+            pipe.hset(USER_TOTALS_HASH, mapping={
+                f'{CHANNEL}-user-U{number:04d}': random.randint(1, 2000)
+                for number in numbers})
+            pipe.hset(WEEKLY_USER_TOTALS_HASH, mapping={
+                f'{CHANNEL}-{year}-{week}-user-U{number:04d}':
+                    random.randint(1, 150) for number in numbers})
+            pipe.execute()
+
+    rds.hset(ALL_TOTALS_HASH, CHANNEL, users * 1000)
+
+
+def command(number):
+    return {'command': '/balance', 'text': '', 'channel_id': CHANNEL_ID,
+            'user_id': f'U{number % CALLERS:04d}'}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+',
+                        default=[100, 10000, 100000])
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = load_app(SlackStub(channels={CHANNEL_ID: CHANNEL}, users=CALLERS))
+    logging.getLogger().setLevel(logging.WARNING)
+
+    timer = StageTimer()
+    app.read_balances = timer.wrap('read_balances', app.read_balances)
+
+    app.warm_slack_caches()
+    _, year, week, _ = app.command_context(command(0))
+
+    for users in args.users:
+        seed_balances(app, users, year, week)
+        timer.reset()
+
+        for number in range(args.requests):
+            acked = []
+            start = time.perf_counter()
+            app.show_balance(acked.append, command(number))
+            timer.record('/balance', time.perf_counter() - start)
+            assert acked, 'the command was not acked'
+
+        print(f'\n{users} users:')
+        print_percentiles(timer, ('/balance', 'read_balances'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Per-save cost of the derived WellnessActivity fields, before and after
+# memoizing the challenge fields per daily post.
+#
+#   python -m benchmarks.bench_challenge_meta
+
+import timeit
+
+from challenge_meta import ChallengeMemo, get_challenge_link, get_date_meta
+
+CHANNEL_ID = 'C03HW2QP3QF'
+CHALLENGE_TS = '1654458051.148919'
+REACTION_TS = '1654995237.000100'
+WORKSPACE_URL = 'https://example.slack.com/'
+
+# what the cached slack lookups cost at best: a dict read
+CHANNELS = {f'C{number:010d}': f'channel-{number}' for number in range(2000)}
+CHANNELS[CHANNEL_ID] = 'wellness-ukraine'
+
+
+def derive_every_time():
+    channel = CHANNELS[CHANNEL_ID]
+    reaction = get_date_meta(REACTION_TS)
+    challenge = get_date_meta(CHALLENGE_TS)
+    link = get_challenge_link(WORKSPACE_URL, CHANNEL_ID, CHALLENGE_TS)
+    return (channel, reaction, challenge, link)
+
+
+memo = ChallengeMemo(CHANNELS.__getitem__, lambda: WORKSPACE_URL)
+
+
+def derive_memoized():
+    challenge = memo.get(CHANNEL_ID, CHALLENGE_TS)
+    reaction = get_date_meta(REACTION_TS)
+    return (challenge, reaction)
+
+
+def main(number=100000):
+    for name, func in (('before', derive_every_time),
+                       ('after', derive_memoized)):
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f'{name:>6}: {best / number * 1e6:.2f} us per save')
+
+
+if __name__ == '__main__':
+    main()
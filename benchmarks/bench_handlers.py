@@ -0,0 +1,193 @@
+# Latency of the reaction_added, view_add and view_edit handlers, driven
+# with synthetic Slack payloads against fakeredis, an in-memory
+# Elasticsearch connection and a stubbed Slack WebClient.
+#
+#   python -m benchmarks.bench_handlers
+#   python -m benchmarks.bench_handlers --events 2000 --concurrency 1 10 \
+#       --slack-latency 50 --es-latency 5
+#
+# For every handler and listener pool size it prints the p50/p95/p99 of the
+# whole handler and of its stages (in ms), the handled events/sec and the
+# time it took the outbox and the bulk buffer to drain afterwards.
+
+import argparse
+import json
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from meta import CUSTOM_DURATION_OPTIONS
+
+from benchmarks.standins import BOT_USER_ID, SlackStub, load_app
+
+CHANNEL_ID = 'C03HW2QP3QF'
+CHALLENGE_TS = '1654458051.148919'
+
+# the functions of app.py timed as stages of the handlers
+STAGES = ('reaction_activity', 'claim_event', 'add_activity_from_view',
+          'save_activity', 'register_activities', 'post_reward_update',
+          'post_dm_update')
+
+
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def print_percentiles(timer, stages):
+    for stage in stages:
+        samples = timer.samples.get(stage)
+        if not samples:
+            continue
+        p50, p95, p99 = (percentile(samples, fraction) * 1000
+                         for fraction in (0.5, 0.95, 0.99))
+        print(f'  {stage:>24}: p50 {p50:8.3f}  p95 {p95:8.3f}  '
+              f'p99 {p99:8.3f}  (n={len(samples)})')
+
+
+def reaction_event(number):
+    return {'type': 'reaction_added',
+            'user': f'U{number % 50:04d}',
+            'reaction': ('family', 'muscle', 'book')[number % 3],
+            'item_user': BOT_USER_ID,
+            'event_ts': f'1654995237.{number:06d}',
+            'item': {'type': 'message', 'channel': CHANNEL_ID,
+                     'ts': CHALLENGE_TS}}
+
+
+def view_body(number, callback_id, values):
+    return {'user': {'id': f'U{number % 50:04d}'},
+            'view': {'callback_id': callback_id,
+                     'private_metadata': json.dumps(
+                         [CHANNEL_ID, CHALLENGE_TS,
+                          f'1654995237.{number:06d}']),
+                     'state': {'values': values}}}
+
+
+def add_view(number):
+    return view_body(number, 'view_add', {'activity_block_id': {
+        'changed-activity': {'selected_option': {
+            'value': 'workout', 'text': {'text': 'Working out'}}},
+        'changed-duration': {
+            'selected_option': CUSTOM_DURATION_OPTIONS[0]}}})
+
+
+def edit_view(number):
+    return view_body(number, 'view_edit', {'selection': {
+        'multi_static_select-action': {'selected_options': [
+            {'value': f'seed-{number}'}]}}})
+
+
+def seed_activities(app, numbers):
+    # the documents deleted by the view_edit runs
+    for number in numbers:
+        activity = app.WellnessActivity(
+            channel_id=CHANNEL_ID, activity='muscle', category='workout',
+            user_name=f'user-U{number % 50:04d}',
+            user_email=f'U{number % 50:04d}@example.com',
+            challenge_ts=CHALLENGE_TS, reaction_ts=f'1654990000.{number:06d}',
+            points=int(CUSTOM_DURATION_OPTIONS[0]['value']))
+        activity.meta.id = f'seed-{number}'
+        activity.save()
+
+
+def run(app, timer, name, handler, payloads, concurrency):
+    timer.reset()
+
+    def handle(payload):
+        start = time.perf_counter()
+        handler(payload)
+        timer.record(name, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(handle, payloads))
+    elapsed = time.perf_counter() - start
+
+    drain_start = time.perf_counter()
+    if app.activity_buffer is not None:
+        app.activity_buffer.flush()
+    app.outbox.flush()
+    drained = time.perf_counter() - drain_start
+
+    print(f'\n{name}, {concurrency} listener threads: '
+          f'{len(payloads) / elapsed:.0f} events/sec, '
+          f'drained in {drained * 1000:.0f} ms')
+    print_percentiles(timer, (name,) + STAGES)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 10])
+    parser.add_argument('--slack-latency', type=float, default=0,
+                        help='ms added to every Slack Web API call')
+    parser.add_argument('--es-latency', type=float, default=0,
+                        help='ms added to every Elasticsearch request')
+    args = parser.parse_args()
+
+    app = load_app(SlackStub(latency=args.slack_latency / 1000,
+                             channels={CHANNEL_ID: 'wellness'}),
+                   es_latency=args.es_latency / 1000)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logger = logging.getLogger('benchmark')
+    logger.setLevel(logging.ERROR)
+
+    timer = StageTimer()
+    for stage in STAGES:
+        setattr(app, stage, timer.wrap(stage, getattr(app, stage)))
+
+    def ack():
+        pass
+
+    handlers = (
+        ('reaction_added', reaction_event,
+         lambda event: app.reaction_added(event, None, logger)),
+        ('handle_add_events', add_view,
+         lambda body: app.handle_add_events(ack, body, logger)),
+        ('handle_edit_events', edit_view,
+         lambda body: app.handle_edit_events(ack, body, logger)),
+    )
+
+    app.warm_slack_caches()
+
+    for run_number, concurrency in enumerate(args.concurrency):
+        # every run uses fresh event timestamps and documents
+        numbers = range(run_number * args.events,
+                        (run_number + 1) * args.events)
+        seed_activities(app, numbers)
+
+        for name, payload, handler in handlers:
+            payloads = [payload(number) for number in numbers]
+            run(app, timer, name, handler, payloads, concurrency)
+
+
+if __name__ == '__main__':
+    main()
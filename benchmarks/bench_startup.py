@@ -0,0 +1,55 @@
+# Startup cost of the cron scripts: the time to import each of them in a
+# fresh interpreter, with the network switched off so an import that tries
+# to reach Slack, Redis or Elasticsearch fails instead of being slow.
+#
+#   python -m benchmarks.bench_startup
+
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ('models', 'report', 'nightly_check', 'daily_reminder')
+
+IMPORT = '''
+import socket, sys, time
+
+def no_network(*args, **kwargs):
+    raise RuntimeError('network access while importing')
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'slack_bolt' in sys.modules)
+'''
+
+ENVIRONMENT = {
+    'SENTRY_TOKEN': '',
+    'SLACK_BOT_TOKEN': 'xoxb-benchmark',
+    'SLACK_POST_CHANNEL': 'wellness',
+    'WELLNESS_INDEX': 'wellness-benchmark',
+}
+
+
+def import_time(module):
+    env = dict(os.environ, **ENVIRONMENT)
+    output = subprocess.run([sys.executable, '-c', IMPORT.format(module=module)],
+                            env=env, check=True, capture_output=True,
+                            text=True).stdout
+    seconds, bolt_imported = output.split()
+    return float(seconds), bolt_imported == 'True'
+
+
+def main(repeat=5):
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(repeat)]
+        times = [seconds * 1000 for seconds, _ in runs]
+        bolt = ' (imports slack_bolt!)' if any(bolt for _, bolt in runs) else ''
+        print(f'{module:>16}: median {statistics.median(times):6.1f} ms, '
+              f'best {min(times):6.1f} ms{bolt}')
+
+
+if __name__ == '__main__':
+    main()
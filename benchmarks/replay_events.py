@@ -0,0 +1,145 @@
+# Feeds Slack requests recorded with EVENT_RECORD_PATH back into the app
+# listeners, against fakeredis, an in-memory Elasticsearch connection and a
+# stubbed Slack WebClient.
+#
+#   EVENT_RECORD_PATH=events.jsonl python app.py      # record
+#   python -m benchmarks.replay_events events.jsonl   # replay at 1x
+#   python -m benchmarks.replay_events events.jsonl --speed 10
+#   python -m benchmarks.replay_events events.jsonl --speed 0  # no pauses
+#
+# It reports the ack latency, how long requests waited for a listener
+# thread, the listener run time, the overall throughput and whether the
+# balances in redis add up to the points written to Elasticsearch.
+
+import argparse
+import logging
+import time
+
+from slack_bolt.request import BoltRequest
+
+from benchmarks.bench_handlers import StageTimer, print_percentiles
+from benchmarks.standins import MemoryConnection, SlackStub, load_app
+from event_recorder import read_recording
+
+
+def recorded_bot_user_id(records):
+    # the stub has to answer auth.test with the recorded bot, otherwise the
+    # reactions on its posts are ignored
+    for _, body in records:
+        for authorization in body.get('authorizations') or []:
+            return authorization['user_id']
+    return None
+
+
+def timed_executor(executor, timer):
+    # records how long each listener waited for a thread and then ran
+    submit = executor.submit
+
+    def timed_submit(func, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            timer.record('queued', started - submitted)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.record('listener', time.perf_counter() - started)
+
+        return submit(run)
+
+    executor.submit = timed_submit
+
+
+def replay(app, records, speed, timer):
+    first = records[0][0]
+    start = time.perf_counter()
+
+    for received, body in records:
+        if speed > 0:
+            delay = (received - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        dispatched = time.perf_counter()
+        app.app.dispatch(BoltRequest(body=body, mode='socket_mode'))
+        timer.record('ack', time.perf_counter() - dispatched)
+
+    # wait for the listeners and everything they queued
+    app.listener_executor.shutdown(wait=True)
+    if app.reaction_coalescer is not None:
+        app.reaction_coalescer.close()
+    if app.activity_buffer is not None:
+        app.activity_buffer.flush()
+    app.outbox.flush()
+
+    return time.perf_counter() - start
+
+
+def check_balances(app):
+    # every activity document (negative ones included) is counted once in
+    # the channel totals
+    from meta import ALL_TOTALS_HASH
+
+    es_totals = {}
+    for source in MemoryConnection.documents.values():
+        es_totals[source['channel']] = (es_totals.get(source['channel'], 0) +
+                                        source['points'])
+
+    redis_totals = {channel: int(points) for channel, points in
+                    app.get_redis().hgetall(ALL_TOTALS_HASH).items()}
+
+    for channel in sorted(set(es_totals) | set(redis_totals)):
+        es_points = es_totals.get(channel, 0)
+        redis_points = redis_totals.get(channel, 0)
+        status = 'ok' if es_points == redis_points else 'MISMATCH'
+        print(f'  {channel}: elasticsearch {es_points}, redis {redis_points}'
+              f' {status}')
+
+    return es_totals == redis_totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='replay speed factor, 0 replays without pauses')
+    parser.add_argument('--slack-latency', type=float, default=0,
+                        help='ms added to every Slack Web API call')
+    parser.add_argument('--es-latency', type=float, default=0,
+                        help='ms added to every Elasticsearch request')
+    args = parser.parse_args()
+
+    records = sorted(read_recording(args.recording), key=lambda r: r[0])
+    if not records:
+        parser.error(f'{args.recording} has no recorded requests')
+
+    slack = SlackStub(latency=args.slack_latency / 1000,
+                      bot_user_id=recorded_bot_user_id(records) or 'UBOT')
+    app = load_app(slack, es_latency=args.es_latency / 1000)
+
+    # the listeners log every balance change as a warning
+    logging.disable(logging.WARNING)
+
+    timer = StageTimer()
+    timed_executor(app.listener_executor, timer)
+
+    app.warm_slack_caches()
+
+    elapsed = replay(app, records, args.speed, timer)
+    recorded = records[-1][0] - records[0][0]
+
+    print(f'{len(records)} requests recorded over {recorded:.1f} s, '
+          f'replayed in {elapsed:.1f} s '
+          f'({len(records) / elapsed:.0f} requests/sec)')
+    print_percentiles(timer, ('ack', 'queued', 'listener'))
+
+    print('slack calls:', ', '.join(f'{method} {count}' for method, count
+                                    in sorted(slack.calls.items())))
+    print('balances:')
+    if not check_balances(app):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
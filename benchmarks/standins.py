@@ -0,0 +1,244 @@
+# In-process stand-ins for Slack, Elasticsearch and Redis, so the handlers
+# of app.py can be driven without any network. Each stand-in can add a fixed
+# latency per call to model the round trip of the real service.
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import fakeredis
+
+from elasticsearch import Connection
+from slack_sdk import WebClient
+from slack_sdk.web.slack_response import SlackResponse
+
+import wellness_redis
+
+BOT_USER_ID = 'UBOT'
+WORKSPACE_URL = 'https://wellness.slack.com/'
+
+
+class SlackStub:
+    # replaces WebClient.api_call, answering the methods the bot uses
+
+    def __init__(self, latency=0.0, channels=None, users=50,
+                 bot_user_id=BOT_USER_ID):
+        self.latency = latency
+        self.bot_user_id = bot_user_id
+        self.channels = channels or {}
+        self.users = [f'U{number:04d}' for number in range(users)]
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def install(self):
+        stub = self
+
+        def api_call(client, api_method, *, http_verb='POST', files=None,
+                     data=None, params=None, json=None, headers=None,
+                     auth=None):
+            args = dict(params or {})
+            args.update(data or {})
+            args.update(json or {})
+            return SlackResponse(client=client, http_verb=http_verb,
+                                 api_url=api_method, req_args={},
+                                 data=stub.respond(api_method, args),
+                                 headers={}, status_code=200)
+
+        WebClient.api_call = api_call
+
+    def respond(self, method, args):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        body = {'ok': True}
+        if method == 'auth.test':
+            body.update(url=WORKSPACE_URL, user_id=self.bot_user_id, team_id='T1',
+                        user='wellness-bot', bot_id='B1')
+        elif method == 'users.info':
+            body['user'] = self.user(args['user'])
+        elif method == 'users.list':
+            body['members'] = [self.user(user_id) for user_id in self.users]
+            body['response_metadata'] = {'next_cursor': ''}
+        elif method == 'conversations.info':
+            channel_id = args['channel']
+            body['channel'] = {'id': channel_id,
+                               'name': self.channels.get(channel_id, 'wellness')}
+        elif method == 'conversations.list':
+            body['channels'] = [{'id': channel_id, 'name': name}
+                                for channel_id, name in self.channels.items()]
+            body['response_metadata'] = {'next_cursor': ''}
+        elif method in ('views.open', 'views.update'):
+            body['view'] = {'id': args.get('view_id', 'V0001'),
+                            'hash': f'{time.time():.6f}'}
+        elif method == 'chat.postMessage':
+            body.update(ts=f'{time.time():.6f}', channel=args.get('channel'))
+        return body
+
+    def user(self, user_id):
+        return {'id': user_id, 'name': f'user-{user_id}', 'is_bot': False,
+                'profile': {'email': f'{user_id}@example.com'}}
+
+
+class MemoryConnection(Connection):
+    # Elasticsearch transport connection keeping documents in a dict. It
+    # understands the requests the bot sends: index/create, get, mget,
+    # update, bulk (with if_seq_no on updates) and (unfiltered) search. Set
+    # MemoryConnection.latency to add a fixed delay per request.
+
+    latency = 0.0
+    documents = {}
+    seq_nos = {}
+    _lock = threading.Lock()
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if isinstance(body, bytes):
+            body = body.decode()
+
+        path = url.split('?')[0].strip('/').split('/')
+        with self._lock:
+            status, response = self._handle(method, path, params or {}, body)
+
+        # like the real connections, turns error answers into exceptions
+        if not 200 <= status < 300 and status not in ignore:
+            self._raise_error(status, json.dumps(response))
+
+        return status, {}, json.dumps(response)
+
+    def _write(self, key, source):
+        self.documents[key] = source
+        self.seq_nos[key] = self.seq_nos.get(key, -1) + 1
+        return self.seq_nos[key]
+
+    def _get(self, index, doc_id):
+        source = self.documents.get((index, doc_id))
+        if source is None:
+            return {'_index': index, '_id': doc_id, 'found': False}
+        return {'_index': index, '_id': doc_id, 'found': True,
+                '_source': source, '_seq_no': self.seq_nos[(index, doc_id)],
+                '_primary_term': 1}
+
+    def _handle(self, method, path, params, body):
+        documents = self.documents
+
+        if method == 'HEAD':
+            return 200, {}
+
+        if path[-1] == '_bulk':
+            return 200, self._bulk(body)
+
+        if path[-1] == '_mget':
+            docs = json.loads(body)['docs']
+            return 200, {'docs': [self._get(doc.get('_index', path[0]),
+                                            doc['_id']) for doc in docs]}
+
+        if path[-1] == '_search':
+            hits = [{'_index': index, '_id': doc_id, '_source': source}
+                    for (index, doc_id), source in documents.items()]
+            return 200, {'hits': {'total': {'value': len(hits)},
+                                  'hits': hits}}
+
+        if len(path) >= 2 and path[1] in ('_doc', '_create'):
+            index = path[0]
+            doc_id = path[2] if len(path) > 2 else uuid.uuid4().hex
+            if method == 'GET':
+                found = self._get(index, doc_id)
+                return (200 if found['found'] else 404), found
+
+            # the client sends the query parameters as bytes
+            create = path[1] == '_create' or \
+                params.get('op_type') in ('create', b'create')
+            if create and (index, doc_id) in documents:
+                return 409, {'status': 409, 'error': {
+                    'type': 'version_conflict_engine_exception'}}
+
+            seq_no = self._write((index, doc_id), json.loads(body))
+            return 201, {'_index': index, '_id': doc_id, 'result': 'created',
+                         '_seq_no': seq_no, '_primary_term': 1}
+
+        if len(path) == 3 and path[1] == '_update':
+            key = (path[0], path[2])
+            seq_no = self._write(key, dict(documents[key],
+                                           **json.loads(body)['doc']))
+            return 200, {'_index': path[0], '_id': path[2],
+                         'result': 'updated', '_seq_no': seq_no,
+                         '_primary_term': 1}
+
+        # index and mapping management
+        return 200, {'acknowledged': True}
+
+    def _bulk(self, body):
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        lines.reverse()
+
+        items = []
+        while lines:
+            op_type, meta = next(iter(lines.pop().items()))
+            key = (meta['_index'], meta.get('_id') or uuid.uuid4().hex)
+
+            if op_type == 'delete':
+                self.documents.pop(key, None)
+                self.seq_nos.pop(key, None)
+                items.append({op_type: {'_id': key[1], 'status': 200}})
+                continue
+
+            source = lines.pop()
+            conflict = op_type == 'create' and key in self.documents
+            if op_type == 'update' and 'if_seq_no' in meta:
+                conflict = meta['if_seq_no'] != self.seq_nos.get(key)
+            if conflict:
+                items.append({op_type: {'_index': key[0], '_id': key[1],
+                                        'status': 409}})
+                continue
+
+            if op_type == 'update':
+                self._write(key, dict(self.documents[key], **source['doc']))
+            else:
+                self._write(key, source)
+            items.append({op_type: {'_index': key[0], '_id': key[1],
+                                    'status': 201}})
+
+        errors = any(result['status'] >= 300
+                     for item in items for result in item.values())
+        return {'took': 0, 'errors': errors, 'items': items}
+
+
+def use_fakeredis():
+    # points wellness_redis at an in-memory server
+    server = fakeredis.FakeServer()
+    wellness_redis.set_pool(wellness_redis.InstrumentedConnectionPool(
+        connection_class=fakeredis.FakeConnection, server=server,
+        decode_responses=True))
+    return server
+
+
+def load_app(slack, es_latency=0.0):
+    # imports app.py with every service replaced by a stand-in
+    os.environ.setdefault('SENTRY_TOKEN', '')
+    os.environ.setdefault('SLACK_BOT_TOKEN', 'xoxb-benchmark')
+    os.environ.setdefault('SLACK_APP_TOKEN', 'xapp-benchmark')
+    os.environ.setdefault('WELLNESS_INDEX', 'wellness-benchmark')
+
+    slack.install()
+    MemoryConnection.latency = es_latency
+    use_fakeredis()
+
+    from elasticsearch_dsl.connections import connections
+    from slack_rate import RateLimiter
+
+    import app
+
+    connections.create_connection(hosts=['memory'],
+                                  connection_class=MemoryConnection)
+    # measure the bot, not Slack's rate limits
+    app.outbox.limiter = RateLimiter(rate_for=lambda method: 1e9)
+
+    return app
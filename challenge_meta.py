@@ -0,0 +1,65 @@
+import collections
+import datetime
+import threading
+
+
+ChallengeMeta = collections.namedtuple('ChallengeMeta',
+                                       ['channel', 'date', 'year', 'week',
+                                        'day', 'link'])
+
+
+def convert_slack_time(ts):
+    dt = datetime.datetime.fromtimestamp(float(ts))
+    return dt
+
+
+def get_date_meta(ts):
+    date = convert_slack_time(ts)
+    sun_week = int(date.strftime("%U"))
+    year, week, day = date.isocalendar()
+    return (date, year, sun_week, day)
+
+
+def get_challenge_link(workspace_url, channel_id, challenge_ts):
+    ts_encoding = str(int(float(challenge_ts)*1000000))
+    return '{}archives/{}/p{}'.format(workspace_url, channel_id, ts_encoding)
+
+
+class ChallengeMemo:
+    # Every reaction on the same daily post shares the challenge fields of
+    # the activity, so they are derived once per (channel_id, challenge_ts)
+    # and kept in a small LRU.
+
+    def __init__(self, channel_name, workspace_url, maxsize=256):
+        self._channel_name = channel_name
+        self._workspace_url = workspace_url
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, channel_id, challenge_ts):
+        key = (channel_id, challenge_ts)
+        with self._lock:
+            meta = self._entries.get(key)
+            if meta is not None:
+                self._entries.move_to_end(key)
+                return meta
+
+        (date, year, week, day) = get_date_meta(challenge_ts)
+        meta = ChallengeMeta(
+            channel=self._channel_name(channel_id),
+            date=date, year=year, week=week, day=day,
+            link=get_challenge_link(self._workspace_url(), channel_id,
+                                    challenge_ts))
+
+        with self._lock:
+            self._entries[key] = meta
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return meta
+
+    def invalidate_channel(self, channel_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == channel_id]:
+                del self._entries[key]
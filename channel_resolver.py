@@ -0,0 +1,45 @@
+import logging
+
+from meta import CHANNEL_IDS_HASH
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_channel_id(rds, client, channel_name):
+    channel_id = rds.hget(CHANNEL_IDS_HASH, channel_name)
+    if channel_id is not None:
+        return channel_id
+
+    # On a miss page through the conversations only until the channel shows
+    # up, caching every page on the way for the next lookups.
+    cursor = None
+    while True:
+        conv_list = client.conversations_list(cursor=cursor, limit=200)
+        page = {channel['name']: channel['id']
+                for channel in conv_list.data['channels']}
+        if page:
+            rds.hset(CHANNEL_IDS_HASH, mapping=page)
+
+        if channel_name in page:
+            logger.info('resolved #%s to %s', channel_name, page[channel_name])
+            return page[channel_name]
+
+        cursor = conv_list['response_metadata']['next_cursor']
+        if cursor == '':
+            break
+
+    raise KeyError(channel_name)
+
+
+def forget_channel(rds, channel_id):
+    stale = [name for name, cached_id in rds.hgetall(CHANNEL_IDS_HASH).items()
+             if cached_id == channel_id]
+    if stale:
+        rds.hdel(CHANNEL_IDS_HASH, *stale)
+
+
+def store_channel(rds, channel):
+    # called from the channel_created and channel_rename events, the old
+    # name of a renamed channel must not resolve any more
+    forget_channel(rds, channel['id'])
+    rds.hset(CHANNEL_IDS_HASH, channel['name'], channel['id'])
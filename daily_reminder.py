@@ -1,51 +1,58 @@
 import datetime
 import os
 import logging
-
-from cachier import cachier
+import time
 
 import humanize
 
-from slack_bolt import App
+from slack_sdk import WebClient
 
 from meta import (CATEGORIES, ALL_TOTALS_HASH,
                   DAILY_TOTALS_HASH, DAILY_UNIQUE_HASH)
 
+from slack_rate import RateLimiter, call_with_retry
+from channel_resolver import resolve_channel_id
 from wellness_redis import get_redis
 
 from dotenv import load_dotenv
 
-import sentry_sdk
+import tracing
 
 load_dotenv()
 
-sentry_sdk.init(
-    os.environ['SENTRY_TOKEN'],
-    traces_sample_rate=1.0
-)
+tracing.init_sentry()
 
 SLACK_BOT_TOKEN = os.environ['SLACK_BOT_TOKEN']
 
 CHANNEL_NAME = os.environ['SLACK_POST_CHANNEL']
 
-app = App(token=SLACK_BOT_TOKEN)
+client = WebClient(token=SLACK_BOT_TOKEN)
+
+
+def seed_reactions(client, channel_id, timestamp, reactions, limiter=None):
+    # Adds the category reactions to the daily post one after another under
+    # the reactions.add rate limit, retrying the rate limited calls. Slack
+    # shows reactions in the order they were added, which keeps the
+    # category buttons in the order of CATEGORIES.
+    if limiter is None:
+        limiter = RateLimiter()
 
+    latencies = {}
+    started = time.perf_counter()
+    for reaction in reactions:
+        call_started = time.perf_counter()
+        call_with_retry(client, 'reactions.add', limiter, name=reaction,
+                        channel=channel_id, timestamp=timestamp)
+        latencies[reaction] = time.perf_counter() - call_started
+    total = time.perf_counter() - started
 
-def get_channel_id(channel_name):
-    cursor = None
-    channels = []
-    while True:
-        conv_list = app.client.conversations_list(cursor=cursor, limit=200)
-        channels.extend(conv_list.data['channels'])
-        cursor = conv_list['response_metadata']['next_cursor']
-        if cursor == '':
-            break
+    for reaction, latency in latencies.items():
+        logging.info('reactions.add %s took %.3fs', reaction, latency)
+    logging.warning('seeded %s reactions in %.3fs (slowest call %.3fs)',
+                    len(latencies), total, max(latencies.values(), default=0))
 
-    channel_mapping = {}
-    for channel in channels:
-        channel_mapping[channel['name']] = channel['id']
+    return (total, latencies)
 
-    return channel_mapping[channel_name]
 
 def get_blocks(text):
     # blocks = [
@@ -226,7 +233,7 @@ def get_blocks(text):
 
 
 def main():
-    channel_id = get_channel_id(CHANNEL_NAME)
+    channel_id = resolve_channel_id(get_redis(), client, CHANNEL_NAME)
 
     war_start = datetime.datetime(day=24, month=2, year=2022)
     now = datetime.datetime.now()
@@ -304,7 +311,7 @@ def main():
         }
     ]
 
-    daily_post_status = app.client.chat_postMessage(
+    daily_post_status = client.chat_postMessage(
         channel=channel_id,
         blocks=blocks,
         text=text
@@ -312,12 +319,8 @@ def main():
 
     timestamp = daily_post_status.data['ts']
 
-    for category in CATEGORIES:
-        app.client.reactions_add(
-            name=category.reaction,
-            channel=channel_id,
-            timestamp=timestamp,
-        )
+    reactions = [category.reaction for category in CATEGORIES]
+    seed_reactions(client, channel_id, timestamp, reactions)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+from meta import COUNTED_EVENTS, PROCESSED_EVENTS
+
+# Slack retries an event within minutes, keep the markers a bit longer
+EVENT_DEDUPE_TTL = int(os.environ.get('EVENT_DEDUPE_TTL', str(24 * 60 * 60)))
+
+
+def reaction_event_id(event):
+    # the same for every delivery of one reaction_added/removed event, also
+    # used as the id of its WellnessActivity document
+    key = '|'.join((event['event_ts'], event['user'], event['reaction'],
+                    event['item']['ts']))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def processed_key(event_id):
+    return f'{PROCESSED_EVENTS}:{event_id}'
+
+
+def counted_key(event_id):
+    return f'{COUNTED_EVENTS}:{event_id}'
+
+
+def claim_event(rds, event_id, ttl=EVENT_DEDUPE_TTL):
+    # True for the first delivery of an event, False for its retries
+    return bool(rds.set(processed_key(event_id), 1, nx=True, ex=ttl))
+
+
+def release_event(rds, event_id):
+    # lets a retry process the event again when handling it failed
+    rds.delete(processed_key(event_id))
+
+
+def queue_event_counted(pipe, event_id, ttl=EVENT_DEDUPE_TTL):
+    # queued on the pipeline applying the points of the event, so the
+    # marker is set if and only if they were counted
+    return pipe.set(counted_key(event_id), 1, ex=ttl)
+
+
+def event_counted(rds, event_id):
+    return bool(rds.exists(counted_key(event_id)))
@@ -0,0 +1,42 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def recording_middleware(path, clock=time.time):
+    # Bolt middleware appending the body of every incoming request (the
+    # Socket Mode envelope payload: event callbacks, view submissions, block
+    # actions, ...) to a JSONL file, one {"received": ..., "body": ...} per
+    # line. The file can be fed back with benchmarks/replay_events.py.
+    # Call its close() at shutdown, requests arriving later are not recorded.
+    lock = threading.Lock()
+    log_file = open(path, 'a')
+
+    logger.info('recording slack requests to %s', path)
+
+    def record_request(body, next):
+        line = json.dumps({'received': clock(), 'body': body})
+        with lock:
+            if not log_file.closed:
+                log_file.write(line + '\n')
+                log_file.flush()
+        next()
+
+    def close():
+        with lock:
+            log_file.close()
+
+    record_request.close = close
+    return record_request
+
+
+def read_recording(path):
+    # yields (received, body) in the order they were recorded
+    with open(path) as log_file:
+        for line in log_file:
+            if line.strip():
+                record = json.loads(line)
+                yield (record['received'], record['body'])
@@ -0,0 +1,71 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import sentry_sdk
+
+from slack_rate import RateLimiter, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+# checkpoints outlive a failed run long enough to rerun it the next morning
+CHECKPOINT_TTL = 2 * 24 * 60 * 60
+
+
+class DMFanout:
+    # Sends the same DM to many users with a bounded worker pool under the
+    # chat.postMessage rate budget. Every delivered recipient is recorded in
+    # a redis set, so a rerun after a crash skips who was already messaged.
+    # A crash between a post and its checkpoint can repeat that one DM.
+
+    def __init__(self, client, rds, checkpoint_key, workers=8, limiter=None):
+        self.client = client
+        self.rds = rds
+        self.checkpoint_key = checkpoint_key
+        self.workers = workers
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self._lock = threading.Lock()
+
+    def delivered(self):
+        return self.rds.smembers(self.checkpoint_key)
+
+    def pending(self, recipients):
+        delivered = self.delivered()
+        return [recipient for recipient in recipients
+                if recipient not in delivered]
+
+    def _deliver(self, recipient, text):
+        call_with_retry(self.client, 'chat.postMessage', self.limiter,
+                        channel=recipient, text=text)
+
+        with self.rds.pipeline() as pipe:
+            pipe.sadd(self.checkpoint_key, recipient)\
+                .expire(self.checkpoint_key, CHECKPOINT_TTL)
+            pipe.execute()
+
+    def send(self, recipients, text, progress=None):
+        # returns (sent, skipped, failed)
+        pending = self.pending(recipients)
+        skipped = len(recipients) - len(pending)
+        if skipped:
+            logger.info('skipping %s recipients already messaged', skipped)
+
+        sent = failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._deliver, recipient, text): recipient
+                       for recipient in pending}
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    sent += 1
+                except Exception as error:
+                    failed += 1
+                    logger.exception('failed to message %s', futures[future])
+                    sentry_sdk.capture_exception(error)
+
+                if progress is not None:
+                    progress.update(1)
+
+        return (sent, skipped, failed)
@@ -0,0 +1,86 @@
+# Rankings of the users by points, kept next to the balances in
+# USER_TOTALS_HASH and WEEKLY_USER_TOTALS_HASH. Reading the top users or the
+# rank of one user costs O(log n) in redis, whatever the number of
+# participants.
+
+import sys
+
+from meta import LEADERBOARD_ZSET, USER_TOTALS_HASH, WEEKLY_USER_TOTALS_HASH
+from wellness_redis import get_redis
+
+
+def all_time_key(channel):
+    return f'{LEADERBOARD_ZSET}:{channel}'
+
+
+def weekly_key(channel, year, week):
+    # year and week of the challenge, see get_date_meta
+    return f'{LEADERBOARD_ZSET}:{channel}-{year}-{week}'
+
+
+def queue_updates(pipe, activity):
+    # queued by queue_activity_updates next to the balances, on a sync or
+    # asyncio pipeline
+    pipe.zincrby(all_time_key(activity.channel), activity.points,
+                 activity.user_name)\
+        .zincrby(weekly_key(activity.channel, activity.challenge_year,
+                            activity.challenge_week),
+                 activity.points, activity.user_name)
+    return pipe
+
+
+def queue_standing(pipe, key, user_name, count):
+    # the top `count` users and the user's rank and points
+    pipe.zrevrange(key, 0, count - 1, withscores=True)\
+        .zrevrank(key, user_name)\
+        .zscore(key, user_name)
+    return pipe
+
+
+def standing_from_results(results):
+    # (top [(user_name, points)], rank starting at 1 or None, points)
+    top, rank, points = results
+    top = [(user_name, int(score)) for user_name, score in top]
+    if rank is None:
+        return top, None, 0
+    return top, rank + 1, int(points)
+
+
+def standings(rds, channel, year, week, user_name, count=10):
+    # the weekly and the all-time standing in one round trip
+    with rds.pipeline(transaction=False) as pipe:
+        queue_standing(pipe, weekly_key(channel, year, week), user_name, count)
+        queue_standing(pipe, all_time_key(channel), user_name, count)
+        results = pipe.execute()
+
+    return standing_from_results(results[:3]), standing_from_results(results[3:])
+
+
+def rebuild(rds, channel, year=None, week=None):
+    # fills the leaderboard of a channel (or of one of its weeks) from the
+    # balances, for the points registered before the leaderboards existed
+    if week is None:
+        key, hash_name, prefix = (all_time_key(channel), USER_TOTALS_HASH,
+                                  f'{channel}-')
+    else:
+        key, hash_name, prefix = (weekly_key(channel, year, week),
+                                  WEEKLY_USER_TOTALS_HASH,
+                                  f'{channel}-{year}-{week}-')
+
+    # the pattern also matches channels named like "<channel>-..." in
+    # USER_TOTALS_HASH, check the result when such channels exist
+    scores = {field[len(prefix):]: int(points) for field, points
+              in rds.hscan_iter(hash_name, match=f'{prefix}*', count=1000)}
+
+    with rds.pipeline() as pipe:
+        pipe.delete(key)
+        if scores:
+            pipe.zadd(key, scores)
+        pipe.execute()
+
+    return len(scores)
+
+
+if __name__ == '__main__':
+    # python leaderboard.py <channel> [<year> <week>]
+    print(rebuild(get_redis(), *sys.argv[1:]), 'users ranked')
@@ -0,0 +1,173 @@
+# Maintenance of the monthly activity partitions (see models.py).
+#
+#   python manage_indices.py setup     # template, this and next month
+#   python manage_indices.py rollover  # daily from cron
+#   python manage_indices.py migrate   # once, before the first setup, to move
+#                                      # the single legacy index
+#   python manage_indices.py reindex   # after a change of MAPPING_VERSION
+
+import argparse
+import datetime
+import os
+import re
+
+from dotenv import load_dotenv
+
+from elasticsearch_dsl.connections import connections
+
+from models import (MAPPING_VERSION, WELLNESS_INDEX, activity_template,
+                    mapping_version, partition_name, setup_elastic)
+
+load_dotenv()
+
+# partitions of challenges older than this many months are force merged and
+# made read-only, activities reported on such old posts fail to save
+WELLNESS_FREEZE_MONTHS = int(os.environ.get('WELLNESS_FREEZE_MONTHS', '3'))
+
+# copies the legacy documents to the partition of their challenge month,
+# challenge_date is stored as an iso timestamp
+PARTITION_SCRIPT = ("ctx._index = params.prefix + "
+                    "ctx._source.challenge_date.substring(0, 7)"
+                    ".replace('-', '.')")
+
+
+def add_months(date, months):
+    # the first day of the month `months` after the month of date
+    month = date.year * 12 + date.month - 1 + months
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+
+def create_partitions(es, today):
+    # the partition of the coming month is created ahead, so its first
+    # activity does not wait for the index creation
+    for months in (0, 1):
+        name = partition_name(add_months(today, months))
+        if not es.indices.exists(index=name):
+            es.indices.create(index=name)
+            print('created', name)
+
+
+def freeze_partitions(es, today):
+    oldest_active = partition_name(add_months(today,
+                                              -WELLNESS_FREEZE_MONTHS))
+    partitions = es.indices.get_settings(index=f'{WELLNESS_INDEX}-*')
+
+    for name, settings in sorted(partitions.items()):
+        blocks = settings['settings']['index'].get('blocks', {})
+        if name >= oldest_active or blocks.get('write') == 'true':
+            continue
+
+        es.indices.forcemerge(index=name, max_num_segments=1,
+                              request_timeout=3600)
+        es.indices.put_settings(index=name,
+                                body={'index.blocks.write': True})
+        print('froze', name)
+
+
+def migrate(es):
+    # moves the documents of the single index named WELLNESS_INDEX to the
+    # partitions and replaces it by the read alias. Stop the bot first,
+    # activities saved meanwhile would be lost.
+    if (not es.indices.exists(index=WELLNESS_INDEX) or
+            es.indices.exists_alias(name=WELLNESS_INDEX)):
+        print(WELLNESS_INDEX, 'is already partitioned')
+        return
+
+    # the alias cannot exist next to the index of the same name
+    activity_template(aliased=False).save()
+
+    result = es.reindex(body={
+        'source': {'index': WELLNESS_INDEX},
+        'dest': {'index': WELLNESS_INDEX, 'op_type': 'create'},
+        'script': {'source': PARTITION_SCRIPT,
+                   'params': {'prefix': f'{WELLNESS_INDEX}-'}},
+    }, refresh=True, wait_for_completion=True, request_timeout=3600)
+    print('copied', result['created'], 'of', result['total'], 'documents')
+    if result['failures']:
+        raise SystemExit(f'reindex failed: {result["failures"][:10]}')
+
+    es.indices.update_aliases(body={'actions': [
+        {'add': {'index': f'{WELLNESS_INDEX}-*', 'alias': WELLNESS_INDEX}},
+        {'remove_index': {'index': WELLNESS_INDEX}},
+    ]})
+    activity_template().save()
+    print(WELLNESS_INDEX, 'is now an alias of',
+          ', '.join(sorted(es.indices.get_alias(name=WELLNESS_INDEX))))
+
+
+def copy_documents(es, source, dest):
+    # external versions copy only the documents created or changed since
+    # the last copy, the others are version conflicts
+    return es.reindex(body={
+        'conflicts': 'proceed',
+        'source': {'index': source},
+        'dest': {'index': dest, 'version_type': 'external'},
+    }, refresh=True, wait_for_completion=True, request_timeout=3600)
+
+
+def reindex_partition(es, index, partition):
+    # Copies a partition to a new index with the current mapping while the
+    # bot keeps using it, then replaces it by an alias of the same name.
+    # Only the final catch up copy blocks the writes, for a moment: the bot
+    # retries the writes rejected by the block for ES_WRITE_BLOCK_TIMEOUT
+    # seconds, a catch up running longer than that drops them.
+    target = f'{partition}-v{MAPPING_VERSION}'
+
+    es.indices.create(index=target)
+    # the template adds the read alias, it would count the copies twice
+    es.indices.delete_alias(index=target, name=WELLNESS_INDEX)
+
+    result = copy_documents(es, index, target)
+    print(index, 'copied', result['created'], 'of', result['total'])
+
+    es.indices.put_settings(index=index, body={'index.blocks.write': True})
+    result = copy_documents(es, index, target)
+    print(index, 'caught up', result['created'] + result['updated'])
+    if result['failures']:
+        es.indices.put_settings(index=index,
+                                body={'index.blocks.write': False})
+        raise SystemExit(f'reindex failed: {result["failures"][:10]}')
+
+    es.indices.update_aliases(body={'actions': [
+        {'remove_index': {'index': index}},
+        {'add': {'index': target, 'alias': WELLNESS_INDEX}},
+        {'add': {'index': target, 'alias': partition}},
+    ]})
+    print(partition, 'is now an alias of', target)
+
+
+def reindex(es):
+    # the partitions are named like the aliases of their reindexed copies
+    for index, mapping in sorted(
+            es.indices.get_mapping(index=f'{WELLNESS_INDEX}-*').items()):
+        if mapping_version(mapping) < MAPPING_VERSION:
+            reindex_partition(es, index, re.sub(r'-v\d+$', '', index))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command',
+                        choices=('setup', 'rollover', 'migrate', 'reindex'))
+    args = parser.parse_args()
+
+    today = datetime.date.today()
+
+    if args.command == 'migrate':
+        connections.create_connection(hosts=[os.environ['ELASTIC_HOST']])
+        migrate(connections.get_connection())
+        return
+
+    setup_elastic(os.environ['ELASTIC_HOST'])
+    es = connections.get_connection()
+
+    if args.command == 'reindex':
+        reindex(es)
+        return
+
+    create_partitions(es, today)
+    if args.command == 'rollover':
+        freeze_partitions(es, today)
+
+
+if __name__ == '__main__':
+    main()
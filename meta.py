@@ -9,6 +9,38 @@ DAILY_TOTALS_HASH = 'daily_points'
 DAILY_UNIQUE_HASH = 'daily_unique'
 WEEKLY_USER_TOTALS_HASH = 'user_weekly_points'
 
+# slack user id -> user name of everybody in the workspace except bots
+SLACK_USERS_HASH = 'slack_users'
+SLACK_USERS_SYNCED = 'slack_users_synced'
+
+# set of member ids per channel, followed by the member joined/left events
+CHANNEL_MEMBERS_SET = 'channel_members'
+CHANNEL_MEMBERS_SYNCED = 'channel_members_synced'
+
+# prefix of the markers of already processed slack events
+PROCESSED_EVENTS = 'processed_events'
+
+# prefix of the markers of slack events whose points were added to the
+# balances, set in the same transaction as the balances
+COUNTED_EVENTS = 'counted_events'
+
+# channel name -> channel id, shared by the bot and the cron scripts
+CHANNEL_IDS_HASH = 'channel_ids'
+
+# set of user ids which already got the nightly reminder of a day
+REMINDERS_SENT_SET = 'reminders_sent'
+
+# prefix of the per user and daily post index of long custom activities,
+# which the delete modal is built from
+LONG_ACTIVITIES_HASH = 'long_activities'
+
+# prefix of the per process snapshots of the bot metrics
+METRICS_HASH = 'wellness_metrics'
+
+# prefix of the sorted sets ranking the users by points, per channel and per
+# channel and challenge week
+LEADERBOARD_ZSET = 'leaderboard'
+
 BALANCE_CAP = 100
 
 WellnessOption = collections.namedtuple('WellnessOption',
@@ -0,0 +1,201 @@
+import bisect
+import contextlib
+import functools
+import http.server
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # the last count is for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Registry:
+    # Counters, latency histograms and gauges of one process, rendered in
+    # the Prometheus text format. Labels are passed as keyword arguments,
+    # like registry.observe('slack_api_seconds', 0.2, method='chat.postMessage')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def gauge(self, name, func, **labels):
+        # func is called whenever the metrics are read, e.g. a queue's qsize
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = func
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        # decorator timing every call of a function into histogram `name`
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        # yields (type, name, sample name with labels, value)
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, histogram.buckets,
+                                 list(histogram.counts), histogram.sum,
+                                 histogram.count)
+                                for key, histogram in self._histograms.items())
+            gauges = sorted(self._gauges.items())
+
+        for (name, labels), value in counters:
+            yield ('counter', name, name + format_labels(labels), value)
+
+        for (name, labels), buckets, counts, total, count in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', bound),)
+                yield ('histogram', name,
+                       f'{name}_bucket{format_labels(bucket_labels)}',
+                       cumulative)
+            yield ('histogram', name, f'{name}_sum{format_labels(labels)}',
+                   total)
+            yield ('histogram', name, f'{name}_count{format_labels(labels)}',
+                   count)
+
+        for (name, labels), func in gauges:
+            try:
+                value = func()
+            except Exception:
+                logger.exception('failed to read gauge %s', name)
+                continue
+            yield ('gauge', name, name + format_labels(labels), value)
+
+    def render(self):
+        lines = []
+        typed = set()
+        for metric_type, name, sample, value in self.samples():
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{sample} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def publish(self, rds, key, ttl):
+        # a snapshot of every sample in a redis hash, for the processes
+        # which do not serve http
+        values = {sample: value for _, _, sample, value in self.samples()}
+        with rds.pipeline() as pipe:
+            pipe.delete(key)
+            if values:
+                pipe.hset(key, mapping=values)
+                pipe.expire(key, ttl)
+            pipe.execute()
+
+
+registry = Registry()
+
+inc = registry.inc
+observe = registry.observe
+gauge = registry.gauge
+timer = registry.timer
+timed = registry.timed
+
+
+def request_type(body):
+    # the event type for Events API requests, otherwise the payload type
+    # (view_submission, block_actions, ...)
+    if body.get('type') == 'event_callback':
+        return body.get('event', {}).get('type', 'unknown')
+    return body.get('type', 'unknown')
+
+
+def count_requests(body, next):
+    # Bolt middleware counting the incoming requests per type
+    inc('slack_requests_total', type=request_type(body))
+    next()
+
+
+def start_http_server(port, registry=registry, address=''):
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    server = http.server.ThreadingHTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='metrics-http', daemon=True)
+    thread.start()
+    logger.info('serving metrics on :%s/metrics', server.server_port)
+    return server
+
+
+def start_publisher(rds_factory, key, interval, registry=registry):
+    stopped = threading.Event()
+
+    def publish_periodically():
+        while not stopped.wait(interval):
+            try:
+                registry.publish(rds_factory(), key, ttl=int(interval * 3))
+            except Exception:
+                logger.exception('failed to publish metrics to %s', key)
+
+    thread = threading.Thread(target=publish_periodically,
+                              name='metrics-publisher', daemon=True)
+    thread.start()
+    return stopped
@@ -0,0 +1,214 @@
+# The Elasticsearch document of an activity and the redis keys of the
+# balances. Kept free of Slack and Bolt so the cron scripts can import it
+# without starting the bot.
+
+import datetime
+import fnmatch
+import logging
+import os
+
+from elasticsearch_dsl import (Boolean, Document, Date, Integer, Keyword,
+                               MetaField)
+from elasticsearch_dsl.connections import connections
+
+from dotenv import load_dotenv
+
+from challenge_meta import convert_slack_time, get_date_meta
+from meta import POINTS_TO_HUMAN_DURATIONS, CATEGORY_TO_DESCRIPTION
+
+load_dotenv()
+
+# Activities are stored in one index (partition) per challenge month, named
+# like wellness-2022.06. WELLNESS_INDEX is the alias reading all of them, see
+# manage_indices.py
+WELLNESS_INDEX = os.environ['WELLNESS_INDEX']
+
+# bumped on every change of the WellnessActivity mapping, partitions with an
+# older one are migrated by manage_indices.py reindex
+MAPPING_VERSION = 2
+
+# the ChallengeMemo deriving the challenge fields on save, set by the bot
+_challenge_memo = None
+
+
+def set_challenge_memo(memo):
+    global _challenge_memo
+    _challenge_memo = memo
+
+
+def get_challenge_memo():
+    if _challenge_memo is None:
+        raise RuntimeError('saving activities needs set_challenge_memo()')
+    return _challenge_memo
+
+
+class WellnessActivity(Document):
+    channel = Keyword()
+    channel_id = Keyword()
+    activity = Keyword()
+    user_name = Keyword()
+    user_email = Keyword()
+
+    # only displayed, never searched or aggregated
+    challenge_link = Keyword(index=False, doc_values=False)
+
+    challenge_ts = Keyword()
+    challenge_date = Date()
+    challenge_year = Integer()
+    challenge_week = Integer()
+    challenge_day = Integer()
+
+    category = Keyword()
+    reaction_ts = Keyword()
+    reaction_date = Date()
+    reaction_year = Integer()
+    reaction_week = Integer()
+    reaction_day = Integer()
+
+    reported_date = Date()
+
+    points = Integer()
+
+    deleted = Boolean()
+
+    class Meta:
+        # fields missing above are kept in the source but not mapped
+        dynamic = MetaField(False)
+        meta = MetaField(version=MAPPING_VERSION)
+
+    class Index:
+        # searches go through the alias, the settings and the mapping are
+        # applied to the partitions by activity_template()
+        name = WELLNESS_INDEX
+        settings = {
+          # a month of activities is small enough for a single shard
+          "number_of_shards": 1,
+          # the queries are scoped to a challenge day or week
+          "sort.field": "challenge_date",
+          "sort.order": "desc",
+        }
+
+    @classmethod
+    def _matches(cls, hit):
+        # search hits come from the partitions behind the alias
+        return fnmatch.fnmatch(hit.get('_index', ''), f'{WELLNESS_INDEX}-*')
+
+    def prepare(self):
+        # fills in the fields derived from the channel and the timestamps
+        challenge = get_challenge_memo().get(self.channel_id,
+                                             self.challenge_ts)
+
+        self.channel = challenge.channel
+        (self.reaction_date, self.reaction_year, self.reaction_week,
+         self.reaction_day) = get_date_meta(self.reaction_ts)
+        (self.challenge_date, self.challenge_year, self.challenge_week,
+         self.challenge_day) = (challenge.date, challenge.year,
+                                challenge.week, challenge.day)
+
+        self.challenge_link = challenge.link
+
+        self.meta.index = partition_name(self.challenge_date)
+
+        if self.deleted is None:
+            self.deleted = False
+
+    def save(self, ** kwargs):
+        self.prepare()
+        return super(WellnessActivity, self).save(** kwargs)
+
+    def is_reported(self):
+        return datetime.datetime.utcnow() >= self.reported_date
+
+    def human_str(self):
+        human_duration = POINTS_TO_HUMAN_DURATIONS[abs(self.points)]
+        human_descr = CATEGORY_TO_DESCRIPTION[self.category]
+        descr = f":{self.activity}: {human_descr} for {human_duration} ({self.points} points)"
+        return descr
+
+
+def activity_search(index=None, **terms):
+    # the activities with every field equal to its term, in filter context:
+    # the clauses are not scored and elasticsearch caches them
+    search = WellnessActivity.search(index=index)
+    for field, value in terms.items():
+        search = search.filter('term', **{field: value})
+    return search
+
+
+def mapping_version(mapping):
+    # version of the mapping of an index, as returned by get_mapping
+    return mapping['mappings'].get('_meta', {}).get('version', 1)
+
+
+def partition_name(date):
+    return f'{WELLNESS_INDEX}-{date:%Y.%m}'
+
+
+def challenge_partition(challenge_ts):
+    # the partition holding the activities reported on a daily post
+    return partition_name(convert_slack_time(challenge_ts))
+
+
+def partitions_between(start, end):
+    # the partitions of the challenges posted from start to end, inclusive
+    month = datetime.date(start.year, start.month, 1)
+    last = datetime.date(end.year, end.month, 1)
+
+    partitions = []
+    while month <= last:
+        partitions.append(partition_name(month))
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+    return partitions
+
+
+def activity_template(aliased=True):
+    # every partition is created with the mapping and the settings of
+    # WellnessActivity and joins the read alias
+    index = WellnessActivity._index.clone()
+    if aliased:
+        index.aliases(**{WELLNESS_INDEX: {}})
+    return index.as_template(WELLNESS_INDEX, pattern=f'{WELLNESS_INDEX}-*')
+
+
+def setup_elastic(elastic_host):
+    es_logger = logging.getLogger('elasticsearch')
+    es_logger.setLevel(logging.WARNING)
+
+    connections.create_connection(hosts=[elastic_host])
+
+    # new partitions would join an alias of the same name as the legacy
+    # index and fail to be created, so every write would fail
+    es = connections.get_connection()
+    if (es.indices.exists(index=WELLNESS_INDEX) and
+            not es.indices.exists_alias(name=WELLNESS_INDEX)):
+        raise RuntimeError(f'{WELLNESS_INDEX} is the legacy single index, '
+                           'run "python manage_indices.py migrate" first')
+
+    # the partitions are created on their first write
+    activity_template().save()
+
+
+def activity_hashes(activity):
+    total_activity_hash = '{}'.format(activity.channel)
+
+    # daily balance for all users
+    # it is useful when you say "Yesterday we all made XXX points"
+    daily_activity_hash = '{}-{}-{}-{}'.format(activity.channel,
+                                               activity.challenge_year,
+                                               activity.challenge_week,
+                                               activity.challenge_day)
+
+    # total balance for each user
+    # Used when user asks how much he contributed total
+    user_activity_hash = '{}-{}'.format(activity.channel,
+                                        activity.user_name)
+
+    # weekly balance for each user
+    # used to tell the user whenthey reached balance_cap
+    weekly_user_activity_hash = '{}-{}-{}-{}'.format(activity.channel,
+                                                     activity.challenge_year,
+                                                     activity.challenge_week,
+                                                     activity.user_name)
+
+    return (total_activity_hash, daily_activity_hash, user_activity_hash,
+            weekly_user_activity_hash)
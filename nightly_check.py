@@ -3,91 +3,42 @@ import os
 import logging
 import random
 
-from cachier import cachier
-
 import humanize
 
-from slack_bolt import App
+from slack_sdk import WebClient
 
 from meta import (BALANCE_CAP, CATEGORIES, ALL_TOTALS_HASH,
-                  DAILY_TOTALS_HASH, DAILY_UNIQUE_HASH)
+                  DAILY_TOTALS_HASH, DAILY_UNIQUE_HASH, REMINDERS_SENT_SET)
 
+from channel_resolver import resolve_channel_id
 from wellness_redis import get_redis
+import slack_directory
+from fanout import DMFanout
 
-from app import setup_elastic, WellnessActivity
+from models import setup_elastic, partitions_between, activity_search
 
 from dotenv import load_dotenv
 
-import sentry_sdk
-
-from elasticsearch_dsl import Q, A
+import tracing
 
 from tqdm import tqdm
 
 load_dotenv()
 
-sentry_sdk.init(
-    os.environ['SENTRY_TOKEN'],
-    traces_sample_rate=1.0
-)
+tracing.init_sentry()
 
 SLACK_BOT_TOKEN = os.environ['SLACK_BOT_TOKEN']
 
 CHANNEL_NAME = os.environ['SLACK_POST_CHANNEL']
 
-app = App(token=SLACK_BOT_TOKEN)
+client = WebClient(token=SLACK_BOT_TOKEN)
 
 ADMIN = 'oleksiy.pikalo'
 
-def get_channel_id(channel_name):
-    cursor = None
-    channels = []
-    while True:
-        conv_list = app.client.conversations_list(cursor=cursor, limit=200)
-        channels.extend(conv_list.data['channels'])
-        cursor = conv_list['response_metadata']['next_cursor']
-        if cursor == '':
-            break
-
-    channel_mapping = {}
-    for channel in channels:
-        channel_mapping[channel['name']] = channel['id']
-
-    return channel_mapping[channel_name]
-
-
-
-def user_names():
-    cursor = None
-    users = []
-    while True:
-        user_list = app.client.users_list(cursor=cursor, limit=200)
-        users.extend(user_list.data['members'])
-        cursor = user_list['response_metadata']['next_cursor']
-        if cursor == '':
-            break
-
-    user_mapping = {}
-    for user in users:
-        if not user['is_bot']:
-            user_mapping[user['id']] = user['name']
-
-    return user_mapping
-
-
-def channel_members(channel_id):
-    cursor = None
-    members = []
-    while True:
-        member_list = app.client.conversations_members(channel=channel_id, cursor=cursor, limit=200)
-        members.extend(member_list.data['members'])
-        cursor = member_list['response_metadata']['next_cursor']
-        if cursor == '':
-            break
-
-    return members
-
-
+# threads sending the reminders, the rate budget is set by SLACK_RATE_LIMITS
+NIGHTLY_FANOUT_WORKERS = int(os.environ.get('NIGHTLY_FANOUT_WORKERS', '8'))
+# skip the preview to ADMIN and the confirmation prompt, e.g. under cron
+NIGHTLY_AUTO_APPROVE = os.environ.get('NIGHTLY_AUTO_APPROVE', '') == '1'
 
 
 def main():
@@ -96,13 +47,19 @@ def main():
 
     setup_elastic(os.environ['ELASTIC_HOST'])
 
-    channel_id = get_channel_id(CHANNEL_NAME)
+    channel_id = resolve_channel_id(get_redis(), client, CHANNEL_NAME)
 
-    weekly_totals_search = WellnessActivity.search().source(False)
-    weekly_totals_search.query = Q('bool', must=[Q('match', channel_id=channel_id),
-                                                 Q('match', challenge_year=year),
-                                                 Q('match', challenge_week=week)])
-    weekly_totals_search.aggs.bucket('users', 'terms', field='user_name.keyword', size=1000).metric('weekly_total', 'sum', field='points')
+    # the challenge weeks are sunday based (see get_date_meta) while the week
+    # matched below is the iso one, either way its activities were posted in
+    # the last 7 days
+    partitions = partitions_between(now - datetime.timedelta(days=7), now)
+
+    weekly_totals_search = activity_search(index=partitions,
+                                           channel_id=channel_id,
+                                           challenge_year=year,
+                                           challenge_week=week)\
+        .params(ignore_unavailable=True).source(False)
+    weekly_totals_search.aggs.bucket('users', 'terms', field='user_name', size=1000).metric('weekly_total', 'sum', field='points')
 
     response = weekly_totals_search.execute()
     users_who_reached_weekly_goal = set()
@@ -113,16 +70,12 @@ def main():
 
     print('reached balance:', users_who_reached_weekly_goal)
 
-    daily_user_search = WellnessActivity.search()
-
-    # the search is already limited to the index and doc_type of our document
-    #daily_user_search = daily_user_search.query('match', *{'channel_id': channel_id, 'day': day, 'week': week, 'year': year})
-
-    # , Q('match', year=year), Q('match', week=week), Q('match', day=day)
-    daily_user_search.query = Q('bool', must=[Q('match', channel_id=channel_id),
-                                              Q('match', challenge_year=year),
-                                              Q('match', challenge_week=week),
-                                              Q('match', challenge_day=day)])
+    daily_user_search = activity_search(index=partitions,
+                                        channel_id=channel_id,
+                                        challenge_year=year,
+                                        challenge_week=week,
+                                        challenge_day=day)\
+        .params(ignore_unavailable=True)
     daily_user_search = daily_user_search.source(['user_name', 'challenge_link'])
 
     results = daily_user_search.scan()
@@ -135,11 +88,14 @@ def main():
         if not challenge_link:
             challenge_link = activity.challenge_link
 
-    users = user_names()
+    # id -> name from the directory the bot keeps in redis
+    users = slack_directory.user_names(get_redis(), client)
 
     #print(users)
 
-    members = channel_members(channel_id=channel_id)
+    # member set the bot keeps in redis from the member joined/left events
+    members = slack_directory.channel_members(get_redis(), channel_id,
+                                              client)
 
     member_names = set()
     for member in members:
@@ -172,16 +128,27 @@ def main():
 
     #reminder_text = random.choice(reminders)
 
-    app.client.chat_postMessage(
-        channel=inv_map[ADMIN],
-        text=reminder_text)
+    fanout = DMFanout(client, get_redis(),
+                      f'{REMINDERS_SENT_SET}:{channel_id}-{year}-{week}-{day}',
+                      workers=NIGHTLY_FANOUT_WORKERS)
+
+    recipients = [inv_map[member] for member in missing_activity]
+    pending = fanout.pending(recipients)
+    print('already reminded:', len(recipients) - len(pending))
 
-    input()
-    for member in tqdm(missing_activity):
-        app.client.chat_postMessage(
-            channel=inv_map[member],
+    if not NIGHTLY_AUTO_APPROVE:
+        # the admin gets the text first to proofread it
+        client.chat_postMessage(
+            channel=inv_map[ADMIN],
             text=reminder_text)
 
+        input(f'Press Enter to remind {len(pending)} members, Ctrl-C to abort')
+
+    with tqdm(total=len(pending)) as progress:
+        sent, skipped, failed = fanout.send(pending, reminder_text, progress)
+
+    print(f'sent: {sent}, skipped: {skipped}, failed: {failed}')
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,87 @@
+import logging
+import threading
+
+import sentry_sdk
+
+logger = logging.getLogger(__name__)
+
+
+def net_activity(items):
+    # Folds the (activity, payload) items of one (user, post, reaction) into
+    # a single one carrying their summed points, or None when they cancel
+    # each other out. The latest activity pointing the same way as the sum
+    # is kept, so a net removal is still recorded as deleted.
+    net = sum(activity.points for activity, _ in items)
+    if net == 0:
+        return None
+
+    for activity, payload in reversed(items):
+        if (activity.points > 0) == (net > 0):
+            activity.points = net
+            return (activity, payload)
+
+
+class ReactionCoalescer:
+    # Holds reactions of a user on one post for `window` seconds after the
+    # first one arrives. Toggling a reaction on and off in that time is
+    # committed once with its net change, or not at all. When the commit
+    # fails, on_failure(activity, items) gets the net activity and every
+    # (activity, payload) folded into it. What is held in memory is lost
+    # when the process crashes.
+
+    def __init__(self, window, commit, timer=threading.Timer,
+                 on_failure=None):
+        self.window = window
+        self.commit = commit
+        self.on_failure = on_failure
+        self._timer = timer
+
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, activity, payload):
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                timer = self._timer(self.window, self.flush_key, args=(key,))
+                timer.daemon = True
+                pending = self._pending[key] = (timer, [])
+                timer.start()
+
+            pending[1].append((activity, payload))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush_key(self, key):
+        with self._lock:
+            pending = self._pending.pop(key, None)
+
+        if pending is None:
+            return
+
+        timer, items = pending
+        timer.cancel()
+
+        net = net_activity(items)
+        if net is None:
+            logger.info('%s reactions on %s cancelled out', len(items), key)
+            return
+
+        activity, payload = net
+        try:
+            self.commit(activity, payload)
+        except Exception as error:
+            logger.exception('failed to commit reactions on %s', key)
+            sentry_sdk.capture_exception(error)
+            if self.on_failure is not None:
+                self.on_failure(activity, items)
+
+    def close(self):
+        # commits everything still held, used on shutdown
+        with self._lock:
+            keys = list(self._pending)
+
+        for key in keys:
+            self.flush_key(key)
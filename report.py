@@ -4,65 +4,47 @@ import os
 import logging
 import pprint
 
-from cachier import cachier
-
 import humanize
 
-from slack_bolt import App
+from slack_sdk import WebClient
 
 from meta import (BALANCE_CAP, CATEGORIES, ALL_TOTALS_HASH,
                   DAILY_TOTALS_HASH, DAILY_UNIQUE_HASH)
 
+from channel_resolver import resolve_channel_id
 from wellness_redis import get_redis
 
-from app import setup_elastic, WellnessActivity
+from models import setup_elastic, activity_search
 
 from dotenv import load_dotenv
 
-import sentry_sdk
+import tracing
 
-from elasticsearch_dsl import Q
+from elasticsearch_dsl import A
 
 from tqdm import tqdm
 
 load_dotenv()
 
-sentry_sdk.init(
-    os.environ['SENTRY_TOKEN'],
-    traces_sample_rate=1.0
-)
+tracing.init_sentry()
 
 SLACK_BOT_TOKEN = os.environ['SLACK_BOT_TOKEN']
 
 CHANNEL_NAME = os.environ['SLACK_POST_CHANNEL']
 
-app = App(token=SLACK_BOT_TOKEN)
+client = WebClient(token=SLACK_BOT_TOKEN)
 
 ADMIN = 'oleksiy.pikalo'
 
-def get_channel_id(channel_name):
-    cursor = None
-    channels = []
-    while True:
-        conv_list = app.client.conversations_list(cursor=cursor, limit=200)
-        channels.extend(conv_list.data['channels'])
-        cursor = conv_list['response_metadata']['next_cursor']
-        if cursor == '':
-            break
-
-    channel_mapping = {}
-    for channel in channels:
-        channel_mapping[channel['name']] = channel['id']
-
-    return channel_mapping[channel_name]
-
+# buckets fetched per request of the weekly totals aggregation
+REPORT_PAGE_SIZE = int(os.environ.get('REPORT_PAGE_SIZE', '1000'))
 
 
 def user_names():
     cursor = None
     users = []
     while True:
-        user_list = app.client.users_list(cursor=cursor, limit=200)
+        user_list = client.users_list(cursor=cursor, limit=200)
         users.extend(user_list.data['members'])
         cursor = user_list['response_metadata']['next_cursor']
         if cursor == '':
@@ -80,7 +62,7 @@ def channel_members(channel_id):
     cursor = None
     members = []
     while True:
-        member_list = app.client.conversations_members(channel=channel_id, cursor=cursor, limit=200)
+        member_list = client.conversations_members(channel=channel_id, cursor=cursor, limit=200)
         members.extend(member_list.data['members'])
         cursor = member_list['response_metadata']['next_cursor']
         if cursor == '':
@@ -91,49 +73,65 @@ def channel_members(channel_id):
 
 
 
-def main():
-    setup_elastic(os.environ['ELASTIC_HOST'])
-    channel_id = get_channel_id(CHANNEL_NAME)
-
-    activity_search = WellnessActivity.search()
+def weekly_user_points(channel_id, page_size=REPORT_PAGE_SIZE):
+    # Sums the points of every user per challenge week on the server and
+    # pages through the buckets with a composite aggregation, so memory is
+    # bounded by the page size instead of the number of activities.
+    # Yields (week, year, user_email, points).
+    after_key = None
+    while True:
+        weekly_search = activity_search(channel_id=channel_id).extra(size=0)
 
-    activity_search.query = Q('bool', must=[Q('match', channel_id=channel_id)])
+        composite = {
+            'size': page_size,
+            'sources': [
+                {'challenge_year': A('terms', field='challenge_year')},
+                {'challenge_week': A('terms', field='challenge_week')},
+                {'user_email': A('terms', field='user_email', missing_bucket=True)},
+            ],
+        }
+        if after_key is not None:
+            composite['after'] = after_key
 
-    activities = activity_search.scan()
+        weekly_search.aggs.bucket('weekly_users', 'composite', **composite)\
+            .metric('points', 'sum', field='points')
 
-    # if True:
-    #     for activity in tqdm(activities):
-    #         with open(os.path.join('backup', activity.meta.id + '.json'), 'w') as fh:
-    #             json.dump(activity.__dict__['_d_'], fh, indent=4, sort_keys=True, default=str)
+        weekly_users = weekly_search.execute().aggregations.weekly_users
 
-    user_weekly_points = {}
-    user_weekly_activities = {}
+        for bucket in weekly_users.buckets:
+            yield (bucket.key.challenge_week, bucket.key.challenge_year,
+                   bucket.key.user_email, int(bucket.points.value))
 
-    for activity in tqdm(activities):
-        key = f"{activity.challenge_week}-{activity.challenge_year}-{activity.user_email}"
+        if len(weekly_users.buckets) < page_size or 'after_key' not in weekly_users:
+            break
 
-        if key not in user_weekly_points:
-            user_weekly_points[key] = []
-            user_weekly_activities[key] = []
+        after_key = weekly_users.after_key.to_dict()
 
-        user_weekly_points[key].append(activity.points)
-        user_weekly_activities[key].append(activity.activity)
 
+def summarize(weekly_points):
     totals = {}
     excess = {}
-    for key, points in user_weekly_points.items():
-        week, year, user = key.split('-', 2)
+    for week, year, user, points in weekly_points:
         totals_key = f'{week}-{year}'
         if totals_key not in totals:
             totals[totals_key] = 0
 
-        totals[totals_key] += min(sum(points), BALANCE_CAP)
+        totals[totals_key] += min(points, BALANCE_CAP)
 
-        if sum(points) - BALANCE_CAP > 0:
+        if points - BALANCE_CAP > 0:
             if user not in excess:
                 excess[user] = 0
 
-            excess[user] += sum(points) - BALANCE_CAP
+            excess[user] += points - BALANCE_CAP
+
+    return (totals, excess)
+
+
+def main():
+    setup_elastic(os.environ['ELASTIC_HOST'])
+    channel_id = resolve_channel_id(get_redis(), client, CHANNEL_NAME)
+
+    totals, excess = summarize(tqdm(weekly_user_points(channel_id)))
 
     print('Weekly Totals')
     pprint.pprint(totals)
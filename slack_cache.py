@@ -0,0 +1,117 @@
+import collections
+import json
+import logging
+import threading
+import time
+
+import redis
+
+from wellness_redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    # in-process LRU with a TTL per entry
+
+    def __init__(self, maxsize=10000, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            expires, value = entry
+            if expires < self._clock():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_MISSING = object()
+
+
+class TieredCache:
+    # Looks values up in the process first, then in redis (shared by the bot
+    # and the cron scripts) and only then calls the loader, which usually is
+    # a Slack Web API call. The local TTL is short so that an invalidation
+    # done by another process is picked up quickly.
+
+    def __init__(self, namespace, ttl, local_ttl=300, maxsize=10000,
+                 redis_factory=get_redis):
+        self.namespace = namespace
+        self.ttl = int(ttl)
+        self.local = LocalCache(maxsize=maxsize, ttl=min(local_ttl, ttl))
+        self._redis_factory = redis_factory
+
+    def _redis_key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def get(self, key, loader):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        try:
+            cached = self._redis_factory().get(self._redis_key(key))
+        except redis.RedisError:
+            logger.exception('%s cache is not available', self.namespace)
+            cached = None
+
+        if cached is not None:
+            value = json.loads(cached)
+            self.local.set(key, value)
+            return value
+
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        for key, value in values.items():
+            self.local.set(key, value)
+
+        try:
+            with self._redis_factory().pipeline(transaction=False) as pipe:
+                for key, value in values.items():
+                    pipe.setex(self._redis_key(key), self.ttl,
+                               json.dumps(value))
+                pipe.execute()
+        except redis.RedisError:
+            logger.exception('%s cache is not available', self.namespace)
+
+    def invalidate(self, key):
+        self.local.pop(key)
+        try:
+            self._redis_factory().delete(self._redis_key(key))
+        except redis.RedisError:
+            logger.exception('%s cache is not available', self.namespace)
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+from meta import (SLACK_USERS_HASH, SLACK_USERS_SYNCED, CHANNEL_MEMBERS_SET,
+                  CHANNEL_MEMBERS_SYNCED)
+
+logger = logging.getLogger(__name__)
+
+
+def list_users(client):
+    cursor = None
+    while True:
+        user_list = client.users_list(cursor=cursor, limit=200)
+        yield from user_list.data['members']
+        cursor = user_list['response_metadata']['next_cursor']
+        if cursor == '':
+            break
+
+
+def store_user(rds, user):
+    # kept current by the user_change and team_join events
+    if user.get('is_bot'):
+        rds.hdel(SLACK_USERS_HASH, user['id'])
+    else:
+        rds.hset(SLACK_USERS_HASH, user['id'], user['name'])
+
+
+def reconcile_users(rds, client):
+    # Slack has no delta API for users_list, so page through it but only
+    # write the users which were added, renamed or turned into bots since the
+    # directory was last synced. Returns the number of changes.
+    stored = rds.hgetall(SLACK_USERS_HASH)
+
+    current = {}
+    for user in list_users(client):
+        if not user['is_bot']:
+            current[user['id']] = user['name']
+
+    changed = {user_id: name for user_id, name in current.items()
+               if stored.get(user_id) != name}
+    removed = [user_id for user_id in stored if user_id not in current]
+
+    with rds.pipeline() as pipe:
+        if changed:
+            pipe.hset(SLACK_USERS_HASH, mapping=changed)
+        if removed:
+            pipe.hdel(SLACK_USERS_HASH, *removed)
+        pipe.set(SLACK_USERS_SYNCED, int(time.time()))
+        pipe.execute()
+
+    logger.info('slack directory: %s users, %s changed, %s removed',
+                len(current), len(changed), len(removed))
+    return len(changed) + len(removed)
+
+
+def user_names(rds, client=None):
+    # id -> name of every non-bot user in one read, the directory is built
+    # first when it has never been synced
+    if client is not None and not rds.exists(SLACK_USERS_SYNCED):
+        reconcile_users(rds, client)
+    return rds.hgetall(SLACK_USERS_HASH)
+
+
+def channel_members_key(channel_id):
+    return f'{CHANNEL_MEMBERS_SET}:{channel_id}'
+
+
+def add_member(rds, channel_id, user_id):
+    rds.sadd(channel_members_key(channel_id), user_id)
+
+
+def remove_member(rds, channel_id, user_id):
+    rds.srem(channel_members_key(channel_id), user_id)
+
+
+def backfill_members(rds, client, channel_id):
+    # one-time seed of the member set, afterwards the member_joined_channel
+    # and member_left_channel events keep it current
+    key = channel_members_key(channel_id)
+    count = 0
+    cursor = None
+    while True:
+        member_list = client.conversations_members(channel=channel_id,
+                                                   cursor=cursor, limit=200)
+        members = member_list.data['members']
+        if members:
+            rds.sadd(key, *members)
+            count += len(members)
+        cursor = member_list['response_metadata']['next_cursor']
+        if cursor == '':
+            break
+
+    rds.hset(CHANNEL_MEMBERS_SYNCED, channel_id, int(time.time()))
+    logger.info('backfilled %s members of %s', count, channel_id)
+    return count
+
+
+def channel_members(rds, channel_id, client=None):
+    if client is not None and not rds.hexists(CHANNEL_MEMBERS_SYNCED,
+                                              channel_id):
+        backfill_members(rds, client, channel_id)
+    return rds.smembers(channel_members_key(channel_id))
+
+
+def start_reconciler(rds_factory, client, interval):
+    stopped = threading.Event()
+
+    def reconcile_periodically():
+        while True:
+            try:
+                reconcile_users(rds_factory(), client)
+            except Exception:
+                logger.exception('failed to reconcile the slack directory')
+
+            if stopped.wait(interval):
+                return
+
+    thread = threading.Thread(target=reconcile_periodically,
+                              name='slack-directory', daemon=True)
+    thread.start()
+    return stopped
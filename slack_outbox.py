@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+import zlib
+
+import sentry_sdk
+
+import metrics
+from slack_rate import RateLimiter, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class SlackOutbox:
+    # Outbound Slack calls are queued by the event handlers and sent by a
+    # small pool of worker threads. Every channel is always served by the
+    # same worker, so the messages to one channel keep their order, while a
+    # rate limited channel only holds back the channels sharing its worker.
+
+    def __init__(self, client, workers=4, limiter=None, max_retries=5):
+        self.client = client
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.max_retries = max_retries
+
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+
+            for number, work_queue in enumerate(self._queues):
+                thread = threading.Thread(target=self._work,
+                                          args=(work_queue,),
+                                          name=f'slack-outbox-{number}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _queue_for(self, channel):
+        shard = zlib.crc32(str(channel).encode()) % len(self._queues)
+        return self._queues[shard]
+
+    def submit(self, method, **kwargs):
+        self.start()
+        self._queue_for(kwargs.get('channel')).put((method, kwargs))
+
+    def chat_postMessage(self, **kwargs):
+        self.submit('chat.postMessage', **kwargs)
+
+    def qsize(self):
+        return sum(work_queue.qsize() for work_queue in self._queues)
+
+    def flush(self):
+        # waits until everything queued so far has been sent
+        for work_queue in self._queues:
+            work_queue.join()
+
+    def stop(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+
+        for thread, work_queue in zip(threads, self._queues):
+            work_queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def _work(self, work_queue):
+        while True:
+            item = work_queue.get()
+            try:
+                if item is _STOP:
+                    return
+
+                method, kwargs = item
+                self._send(method, kwargs)
+            finally:
+                work_queue.task_done()
+
+    def _send(self, method, kwargs):
+        try:
+            with metrics.timer('slack_api_seconds', method=method), \
+                    sentry_sdk.start_transaction(op='slack.outbox',
+                                                 name=method):
+                call_with_retry(self.client, method, self.limiter,
+                                max_retries=self.max_retries, **kwargs)
+        except Exception as error:
+            metrics.inc('slack_api_errors_total', method=method)
+            logger.exception('failed to send %s to %s', method,
+                             kwargs.get('channel'))
+            sentry_sdk.capture_exception(error)
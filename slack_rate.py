@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+# Requests per minute for each Slack Web API tier,
+# see https://api.slack.com/docs/rate-limits
+TIER_RATES = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+METHOD_TIERS = {
+    'auth.test': 4,
+    'conversations.list': 2,
+    'conversations.members': 4,
+    'reactions.add': 3,
+    'users.info': 4,
+    'users.list': 2,
+    'views.open': 4,
+    'views.update': 4,
+}
+
+# chat.postMessage has a "special" limit of about one message per second per
+# channel with bursts allowed, and a workspace wide limit of several hundred
+# messages per minute
+SPECIAL_RATES = {
+    'chat.postMessage': 300,
+}
+
+
+def parse_rate_overrides(overrides):
+    # "chat.postMessage=120,reactions.add=20" -> {'chat.postMessage': 120, ...}
+    rates = {}
+    for override in overrides.split(','):
+        if not override.strip():
+            continue
+        method, rate = override.split('=')
+        rates[method.strip()] = float(rate)
+    return rates
+
+
+RATE_OVERRIDES = parse_rate_overrides(os.environ.get('SLACK_RATE_LIMITS', ''))
+
+
+def method_rate(method):
+    # requests per minute allowed for a Slack Web API method
+    if method in RATE_OVERRIDES:
+        return RATE_OVERRIDES[method]
+    if method in SPECIAL_RATES:
+        return SPECIAL_RATES[method]
+    return TIER_RATES[METHOD_TIERS.get(method, 3)]
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        # rate is in tokens per second
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        # blocks until a token is available, returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        # stop handing out tokens, used when Slack answers with Retry-After
+        with self._lock:
+            now = self._clock()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0
+            self._updated = now
+
+
+# One token bucket per Web API method, shared between threads. Slack counts
+# requests per minute, so by default a bucket holds one minute worth of
+# requests and bursts up to that are let through.
+class RateLimiter:
+    def __init__(self, rate_for=method_rate, **bucket_kwargs):
+        self._rate_for = rate_for
+        self._bucket_kwargs = bucket_kwargs
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, method):
+        with self._lock:
+            if method not in self._buckets:
+                per_minute = self._rate_for(method)
+                bucket_kwargs = dict(self._bucket_kwargs)
+                bucket_kwargs.setdefault('capacity', per_minute)
+                self._buckets[method] = TokenBucket(per_minute / 60.0,
+                                                    **bucket_kwargs)
+            return self._buckets[method]
+
+    def acquire(self, method):
+        return self.bucket(method).acquire()
+
+    def pause(self, method, seconds):
+        self.bucket(method).pause(seconds)
+
+
+def retry_after(error):
+    # seconds to wait before retrying a rate limited call, None when the
+    # error is not a rate limit
+    if not isinstance(error, SlackApiError):
+        return None
+
+    response = error.response
+    if response is None or response.status_code != 429:
+        return None
+
+    headers = {k.lower(): v for k, v in (response.headers or {}).items()}
+    value = headers.get('retry-after', 1)
+    if isinstance(value, (list, tuple)):
+        value = value[0]
+    return float(value)
+
+
+def call_with_retry(client, method, limiter, max_retries=5, **kwargs):
+    # calls a Web API method (like 'reactions.add') under the rate limiter,
+    # the next acquire() waits out the Retry-After of a 429 answer
+    api_method = getattr(client, method.replace('.', '_'))
+
+    attempt = 0
+    while True:
+        limiter.acquire(method)
+        try:
+            return api_method(**kwargs)
+        except SlackApiError as error:
+            delay = retry_after(error)
+            if delay is None or attempt >= max_retries:
+                raise
+
+            attempt += 1
+            logger.warning('%s is rate limited, retrying in %ss (attempt %s)',
+                           method, delay, attempt)
+            limiter.pause(method, delay)
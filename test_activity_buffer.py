@@ -0,0 +1,152 @@
+import json
+
+from elasticsearch import Connection, Elasticsearch
+from elasticsearch_dsl import Document, Integer, Keyword
+from elasticsearch_dsl.connections import connections
+
+from activity_buffer import ActivityBuffer
+
+
+class BulkConnection(Connection):
+    requests = []
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.requests.append(lines)
+
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            op_type, meta = next(iter(action.items()))
+            if source['points'] < 0:
+                items.append({op_type: {'_index': meta['_index'],
+                                        'status': 400,
+                                        'error': {'type': 'mapper_parsing_exception'}}})
+            else:
+                items.append({op_type: {'_index': meta['_index'],
+                                        'status': 201, 'result': 'created'}})
+        return 200, {}, json.dumps({'errors': True, 'items': items})
+
+
+class BlockedConnection(Connection):
+    # rejects the writes of the first bulk request like a write blocked index
+    requests = []
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.requests.append(lines)
+
+        items = []
+        for action in lines[::2]:
+            op_type, meta = next(iter(action.items()))
+            if len(self.requests) == 1:
+                items.append({op_type: {'_index': meta['_index'],
+                                        'status': 403,
+                                        'error': {'type': 'cluster_block_exception'}}})
+            else:
+                items.append({op_type: {'_index': meta['_index'],
+                                        'status': 201, 'result': 'created'}})
+        return 200, {}, json.dumps({'errors': True, 'items': items})
+
+
+class Activity(Document):
+    user_name = Keyword()
+    points = Integer()
+
+    class Index:
+        name = 'activities'
+
+    def prepare(self):
+        self.user_name = self.user_name.lower()
+
+
+def test_flushes_when_full_and_reports_failures():
+    BulkConnection.requests = []
+    connections.add_connection('bulk', Elasticsearch(connection_class=BulkConnection))
+
+    failures = []
+    buffer = ActivityBuffer(max_docs=3, max_delay=60, using='bulk',
+                            on_failure=failures.append)
+
+    buffer.add(Activity(user_name='A', points=10))
+    buffer.add(Activity(user_name='B', points=-5))
+    assert len(buffer) == 2
+    assert BulkConnection.requests == []
+
+    buffer.add(Activity(user_name='C', points=5))
+    assert len(buffer) == 0
+    assert len(BulkConnection.requests) == 1
+
+    request = BulkConnection.requests[0]
+    assert request[0] == {'index': {'_index': 'activities'}}
+    assert [source['user_name'] for source in request[1::2]] == ['a', 'b', 'c']
+    assert len(failures) == 1
+
+    buffer.add(Activity(user_name='D', points=1))
+    buffer.close()
+    assert len(BulkConnection.requests) == 2
+
+
+def test_requeues_writes_rejected_by_a_write_block():
+    BlockedConnection.requests = []
+    connections.add_connection('blocked', Elasticsearch(connection_class=BlockedConnection))
+
+    failures = []
+    buffer = ActivityBuffer(max_docs=10, max_delay=60, using='blocked',
+                            on_failure=failures.append)
+
+    buffer.add(Activity(user_name='A', points=10))
+    assert buffer.flush() == (0, 0)
+    assert len(buffer) == 1
+
+    buffer.add(Activity(user_name='B', points=5))
+    assert buffer.flush() == (2, 0)
+    assert len(buffer) == 0
+    assert failures == []
+    assert [source['user_name']
+            for source in BlockedConnection.requests[1][1::2]] == ['a', 'b']
+
+
+def test_gives_up_on_a_write_block_after_the_timeout():
+    BlockedConnection.requests = []
+    connections.add_connection('blocked', Elasticsearch(connection_class=BlockedConnection))
+
+    failures = []
+    buffer = ActivityBuffer(max_docs=10, max_delay=60, using='blocked',
+                            on_failure=failures.append, block_timeout=0)
+
+    buffer.add(Activity(user_name='A', points=10))
+    assert buffer.flush() == (0, 1)
+    assert len(buffer) == 0
+    assert len(failures) == 1
+
+
+def test_keeps_the_batch_when_the_bulk_request_fails():
+    BulkConnection.requests = []
+    failures = []
+    # the connection does not exist yet, so the request fails before any
+    # document was answered
+    buffer = ActivityBuffer(max_docs=10, max_delay=60, using='late',
+                            on_failure=failures.append)
+
+    buffer.add(Activity(user_name='A', points=10))
+    buffer.add(Activity(user_name='B', points=5))
+    assert buffer.flush() == (0, 0)
+    assert len(buffer) == 2
+
+    connections.add_connection('late', Elasticsearch(connection_class=BulkConnection))
+    assert buffer.flush() == (2, 0)
+    assert failures == []
+
+
+def test_reports_the_batch_of_a_failed_bulk_request_after_the_timeout():
+    failures = []
+    buffer = ActivityBuffer(max_docs=10, max_delay=60, using='missing',
+                            on_failure=failures.append, block_timeout=0)
+
+    buffer.add(Activity(user_name='A', points=10))
+    assert buffer.flush() == (0, 1)
+    assert len(buffer) == 0
+    [item] = failures
+    assert item['index']['_index'] == 'activities'
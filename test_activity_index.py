@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import fakeredis
+
+import activity_index
+
+
+def activity(doc_id, points, reaction_ts, user_name='opikalo'):
+    return SimpleNamespace(meta=SimpleNamespace(id=doc_id),
+                           channel_id='C1', challenge_ts='1654458051.148919',
+                           user_name=user_name, activity='muscle',
+                           category='workout', points=points,
+                           reaction_ts=reaction_ts)
+
+
+KEY = activity_index.index_key('C1', '1654458051.148919', 'opikalo')
+
+
+def test_index_is_filled_from_search_once():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    # added before the post was ever indexed
+    activity_index.add_activity(rds, activity('new', 30, '1654995300.0'))
+    assert activity_index.load_activities(rds, KEY) is None
+
+    activity_index.store_activities(rds, KEY, [activity('old', 20,
+                                                        '1654995200.0')])
+    entries = activity_index.load_activities(rds, KEY)
+    assert [doc_id for doc_id, _ in entries] == ['old', 'new']
+    assert entries[1][1] == {'activity': 'muscle', 'category': 'workout',
+                             'points': 30, 'reaction_ts': '1654995300.0'}
+    assert 0 < rds.ttl(KEY) <= activity_index.ACTIVITY_INDEX_TTL
+
+
+def test_short_and_removed_activities_are_not_listed():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    activity_index.store_activities(rds, KEY, [])
+
+    activity_index.add_activity(rds, activity('short', 10, '1654995100.0'))
+    activity_index.add_activity(rds, activity('long', 20, '1654995200.0'))
+    activity_index.add_activity(rds, activity('other', 20, '1654995300.0',
+                                              user_name='someone'))
+    assert [doc_id for doc_id, _ in
+            activity_index.load_activities(rds, KEY)] == ['long']
+
+    activity_index.remove_activities(rds, KEY, ['long'])
+    assert activity_index.load_activities(rds, KEY) == []
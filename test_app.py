@@ -1,6 +1,52 @@
-from app import get_reaction_icon
+import logging
+
+from app import (get_reaction_icon, WellnessActivity, deleted_from_results,
+                 deleted_activity_id, leaderboard_message, balance_message)
 
 
 def test_reaction():
     reaction = 'cook::skin-tone-5'
     assert get_reaction_icon(reaction) == 'cook'
+
+
+def test_deleted_from_results():
+    deletions = []
+    for doc_id in ('a', 'b', 'c'):
+        record = WellnessActivity(points=20)
+        record.meta.id = doc_id
+        deletions.append((record, WellnessActivity(points=-20)))
+
+    # 'b' was deleted by another request, 'c' changed meanwhile but its
+    # negative entry is new
+    results = [(True, {}), (True, {}),
+               (False, {}), (False, {}),
+               (False, {}), (True, {})]
+
+    deleted = deleted_from_results(deletions, results,
+                                   logging.getLogger(__name__))
+
+    assert [record.meta.id for record, _ in deleted] == ['a', 'c']
+    assert deleted_activity_id(deletions[0][0]) == 'a-deleted'
+
+
+def test_leaderboard_message():
+    text = leaderboard_message('wellness', ([], None, 0),
+                               ([('ann', 80), ('bob', 30)], 7, 10), 'eve')
+
+    assert text.split('\n') == [
+        '*This week in #wellness*: no points yet', '',
+        '*All time in #wellness*', '1. ann: 80 points', '2. bob: 30 points',
+        '_you are #7 with 10 points_']
+
+
+def test_balance_message():
+    text = balance_message('wellness', 80, 240, 12345)
+
+    assert text.split('\n') == [
+        'Your weekly balance in #wellness is 80 out of 100 points, grand '
+        'total is 240 points.',
+        '10 more points for the :drop_of_blood: badge: Emergency medical '
+        'supplies for the front line.',
+        'Together #wellness collected 12345 points.']
+
+    assert len(balance_message('wellness', 0, 5000, 5000).split('\n')) == 2
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+
+import fakeredis.aioredis
+import pytest
+import redis.asyncio
+from elasticsearch import ConflictError
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+
+import slack_directory
+import wellness_redis
+from benchmarks.standins import BOT_USER_ID, SlackStub, load_app
+
+# app.py with stubbed slack, elasticsearch and redis, app_async.py reuses it
+app = load_app(SlackStub())
+
+import app_async  # noqa: E402
+
+CHANNEL_ID = 'C03HW2QP3QF'
+CHALLENGE_TS = '1654458051.148919'
+
+logger = logging.getLogger(__name__)
+
+
+class FakeAsyncElasticsearch:
+    def __init__(self):
+        self.docs = {}
+
+    async def index(self, index, body, id=None, op_type='index'):
+        doc_id = id or str(len(self.docs))
+        if op_type == 'create' and doc_id in self.docs:
+            raise ConflictError(409, 'version_conflict_engine_exception', {})
+        self.docs[doc_id] = body
+        return {'_id': doc_id}
+
+
+def use_async_stubs(monkeypatch):
+    # the async redis client shares the in-memory server of app.py
+    server = wellness_redis.get_pool().connection_kwargs['server']
+    wellness_redis.set_async_pool(redis.asyncio.ConnectionPool(
+        connection_class=fakeredis.aioredis.FakeConnection, server=server,
+        decode_responses=True))
+
+    es = FakeAsyncElasticsearch()
+    monkeypatch.setattr(app_async, 'es', es)
+
+    posted = []
+
+    async def api_call(client, api_method, *, http_verb='POST', files=None,
+                       data=None, params=None, json=None, headers=None,
+                       auth=None):
+        posted.append((api_method, dict(json or data or params or {})))
+        return AsyncSlackResponse(client=client, http_verb=http_verb,
+                                  api_url=api_method, req_args={},
+                                  data={'ok': True}, headers={},
+                                  status_code=200)
+
+    monkeypatch.setattr(AsyncWebClient, 'api_call', api_call)
+    return es, posted
+
+
+def reaction_event(event_ts):
+    return {'type': 'reaction_added',
+            'user': 'U0001',
+            'reaction': 'family',
+            'item_user': BOT_USER_ID,
+            'event_ts': event_ts,
+            'item': {'type': 'message', 'channel': CHANNEL_ID,
+                     'ts': CHALLENGE_TS}}
+
+
+def test_reaction_is_counted_once(monkeypatch):
+    es, posted = use_async_stubs(monkeypatch)
+
+    async def react():
+        event = reaction_event('1654995237.000001')
+        await app_async.reaction_added(event, logger)
+        # a redelivery of the same event
+        await app_async.reaction_added(event, logger)
+        await app_async.reaction_added(reaction_event('1654995237.000002'),
+                                       logger)
+
+    asyncio.run(react())
+
+    assert len(es.docs) == 2
+    assert [method for method, _ in posted] == ['chat.postMessage'] * 2
+    assert posted[0][1]['channel'] == 'U0001'
+
+
+def test_reaction_is_counted_after_a_failed_delivery(monkeypatch):
+    es, posted = use_async_stubs(monkeypatch)
+    rds = wellness_redis.get_redis()
+    queue_activity_updates = app_async.queue_activity_updates
+    failures = [ConnectionError('redis is down')]
+
+    def flaky_updates(pipe, activity):
+        if failures:
+            raise failures.pop()
+        return queue_activity_updates(pipe, activity)
+
+    monkeypatch.setattr(app_async, 'queue_activity_updates', flaky_updates)
+    event = reaction_event('1654995237.000003')
+    user_points = 'wellness-2022-23-user-U0001'
+
+    async def react():
+        # the document is written, the points are not counted
+        with pytest.raises(ConnectionError):
+            await app_async.reaction_added(event, logger)
+        assert posted == []
+        before = int(rds.hget('user_weekly_points', user_points) or 0)
+
+        # slack's retry counts them despite the create conflict
+        await app_async.reaction_added(event, logger)
+        notified = len(posted)
+
+        # a delivery getting past the claim is stopped by the create
+        rds.delete(*rds.keys('processed_events:*'))
+        await app_async.reaction_added(event, logger)
+        assert len(posted) == notified > 0
+        return before
+
+    before = asyncio.run(react())
+
+    assert len(es.docs) == 1
+    assert int(rds.hget('user_weekly_points', user_points)) == before + 10
+
+
+def test_member_events_keep_directory_current(monkeypatch):
+    _, posted = use_async_stubs(monkeypatch)
+    rds = wellness_redis.get_redis()
+    members = slack_directory.channel_members_key('C1')
+
+    event = {'type': 'member_joined_channel', 'channel': 'C1',
+             'user': 'U0002'}
+    asyncio.run(app_async.member_joined(event, app_async.app.client))
+    assert rds.smembers(members) == {'U0002'}
+    assert posted == [('chat.postMessage',
+                       {'channel': 'U0002',
+                        'text': 'welcome to the challenge'})]
+
+    body = {'event': dict(event, type='member_left_channel')}
+    asyncio.run(app_async.handle_member_left_channel_events(body, logger))
+    assert rds.smembers(members) == set()
+
+
+def test_balance_from_a_dm(monkeypatch):
+    use_async_stubs(monkeypatch)
+    monkeypatch.setattr(app, 'SLACK_POST_CHANNEL', None)
+    replies = []
+
+    async def ack(text):
+        replies.append(text)
+
+    body = {'user_id': 'U0001', 'channel_id': 'D0001', 'text': ''}
+    monkeypatch.setattr(app, 'get_channel_name',
+                        lambda channel_id: {}['name'])
+    asyncio.run(app_async.show_balance(ack, body))
+    asyncio.run(app_async.show_leaderboard(ack, body))
+
+    assert replies == [
+        'Please name the challenge channel, like `/balance #wellness`',
+        'Please name the challenge channel, like `/leaderboard #wellness`']
@@ -0,0 +1,29 @@
+from challenge_meta import ChallengeMemo, get_date_meta
+
+
+def test_memo_resolves_once_per_post():
+    lookups = []
+
+    def channel_name(channel_id):
+        lookups.append(channel_id)
+        return 'wellness'
+
+    memo = ChallengeMemo(channel_name, lambda: 'https://ws.slack.com/',
+                         maxsize=2)
+
+    meta = memo.get('C1', '1654458051.148919')
+    assert memo.get('C1', '1654458051.148919') is meta
+    assert meta.channel == 'wellness'
+    assert meta.link == 'https://ws.slack.com/archives/C1/p1654458051148919'
+    assert (meta.date, meta.year, meta.week, meta.day) == get_date_meta('1654458051.148919')
+    assert lookups == ['C1']
+
+    memo.invalidate_channel('C1')
+    memo.get('C1', '1654458051.148919')
+    assert lookups == ['C1', 'C1']
+
+    memo.get('C2', '1654458051.148919')
+    memo.get('C3', '1654458051.148919')
+    memo.get('C1', '1654458051.148919')
+    assert lookups[-1] == 'C1'
+    assert len(lookups) == 5
@@ -0,0 +1,50 @@
+import fakeredis
+import pytest
+
+from channel_resolver import resolve_channel_id, store_channel
+
+
+class FakeResponse(dict):
+    @property
+    def data(self):
+        return self
+
+
+class ChannelsClient:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = 0
+
+    def conversations_list(self, cursor=None, limit=200):
+        page = int(cursor or 0)
+        self.calls += 1
+        next_cursor = str(page + 1) if page + 1 < len(self.pages) else ''
+        return FakeResponse({'channels': self.pages[page],
+                             'response_metadata': {'next_cursor': next_cursor}})
+
+
+def test_miss_stops_paging_once_found():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    client = ChannelsClient([[{'id': 'C1', 'name': 'general'}],
+                             [{'id': 'C2', 'name': 'wellness'}],
+                             [{'id': 'C3', 'name': 'random'}]])
+
+    assert resolve_channel_id(rds, client, 'wellness') == 'C2'
+    assert client.calls == 2
+
+    assert resolve_channel_id(rds, client, 'general') == 'C1'
+    assert resolve_channel_id(rds, client, 'wellness') == 'C2'
+    assert client.calls == 2
+
+
+def test_rename_replaces_old_name():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    client = ChannelsClient([[{'id': 'C2', 'name': 'wellness'}]])
+    resolve_channel_id(rds, client, 'wellness')
+
+    store_channel(rds, {'id': 'C2', 'name': 'wellness-ukraine'})
+    client.pages = [[{'id': 'C2', 'name': 'wellness-ukraine'}]]
+
+    assert resolve_channel_id(rds, client, 'wellness-ukraine') == 'C2'
+    with pytest.raises(KeyError):
+        resolve_channel_id(rds, client, 'wellness')
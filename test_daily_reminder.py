@@ -0,0 +1,52 @@
+import os
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+
+from slack_rate import RateLimiter
+
+# daily_reminder.py reads its configuration when it is imported
+os.environ.setdefault('SENTRY_TOKEN', '')
+os.environ.setdefault('SLACK_BOT_TOKEN', 'xoxb-test')
+os.environ.setdefault('SLACK_POST_CHANNEL', 'wellness')
+
+from daily_reminder import seed_reactions  # noqa: E402
+
+
+def rate_limited(retry_after_seconds):
+    response = SlackResponse(client=None, http_verb='POST',
+                             api_url='reactions.add', req_args={},
+                             data={'ok': False, 'error': 'ratelimited'},
+                             headers={'Retry-After': str(retry_after_seconds)},
+                             status_code=429)
+    return SlackApiError('ratelimited', response)
+
+
+class ReactionsClient:
+    # answers the first reactions.add of a reaction with a 429
+    def __init__(self, rate_limited_reaction, retry_after_seconds):
+        self.rate_limited_reaction = rate_limited_reaction
+        self.retry_after_seconds = retry_after_seconds
+        self.calls = []
+
+    def reactions_add(self, name, channel, timestamp):
+        self.calls.append(name)
+        if self.calls.count(name) == 1 and name == self.rate_limited_reaction:
+            raise rate_limited(self.retry_after_seconds)
+
+
+def test_seed_reactions_retries_rate_limited_calls():
+    client = ReactionsClient('muscle', 0.2)
+    reactions = ['family', 'muscle', 'book', 'bike']
+    limiter = RateLimiter(rate_for=lambda method: 6000)
+
+    total, latencies = seed_reactions(client, 'C1', '1654995237.000100',
+                                      reactions, limiter=limiter)
+
+    # added in order, the rate limited call is retried before the next one
+    assert client.calls == ['family', 'muscle', 'muscle', 'book', 'bike']
+
+    # one latency per reaction, the retried call includes the Retry-After
+    assert list(latencies) == reactions
+    assert latencies['muscle'] >= 0.2
+    assert total >= sum(latencies.values())
@@ -0,0 +1,54 @@
+import fakeredis
+
+from event_dedupe import (claim_event, event_counted, queue_event_counted,
+                          reaction_event_id, release_event)
+
+
+def reaction_event(**changes):
+    event = {'type': 'reaction_added', 'user': 'U1', 'reaction': 'walking',
+             'event_ts': '1656000000.000200',
+             'item': {'type': 'message', 'channel': 'C1',
+                      'ts': '1656000000.000100'}}
+    event.update(changes)
+    return event
+
+
+def test_event_id_is_stable_across_deliveries():
+    assert reaction_event_id(reaction_event()) == reaction_event_id(reaction_event())
+    assert (reaction_event_id(reaction_event()) !=
+            reaction_event_id(reaction_event(event_ts='1656000001.000200')))
+
+
+def test_only_first_delivery_is_claimed():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    event_id = reaction_event_id(reaction_event())
+
+    assert claim_event(rds, event_id)
+    assert not claim_event(rds, event_id)
+    assert 0 < rds.ttl(f'processed_events:{event_id}') <= 24 * 60 * 60
+
+
+def test_released_event_can_be_claimed_again():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    event_id = reaction_event_id(reaction_event())
+
+    assert claim_event(rds, event_id)
+    release_event(rds, event_id)
+    assert claim_event(rds, event_id)
+
+
+def test_event_is_counted_with_its_pipeline():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    event_id = reaction_event_id(reaction_event())
+
+    with rds.pipeline() as pipe:
+        pipe.hincrby('totals', 'wellness', 10)
+        queue_event_counted(pipe, event_id)
+        pipe.reset()
+    assert not event_counted(rds, event_id)
+
+    with rds.pipeline() as pipe:
+        pipe.hincrby('totals', 'wellness', 10)
+        queue_event_counted(pipe, event_id)
+        pipe.execute()
+    assert event_counted(rds, event_id)
@@ -0,0 +1,32 @@
+from event_recorder import read_recording, recording_middleware
+
+
+def test_requests_are_recorded_and_read_back(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    clock = iter([100.0, 100.5]).__next__
+    record = recording_middleware(str(path), clock=clock)
+
+    passed = []
+    bodies = [{'type': 'event_callback',
+               'event': {'type': 'reaction_added', 'reaction': 'family'}},
+              {'type': 'view_submission', 'view': {'callback_id': 'view_add'}}]
+    for body in bodies:
+        record(body=body, next=lambda: passed.append(True))
+
+    assert passed == [True, True]
+    assert list(read_recording(str(path))) == [(100.0, bodies[0]),
+                                               (100.5, bodies[1])]
+
+
+def test_nothing_is_recorded_after_close(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    record = recording_middleware(str(path), clock=lambda: 100.0)
+
+    passed = []
+    record(body={'type': 'event_callback'}, next=lambda: passed.append(True))
+    record.close()
+    record(body={'type': 'view_submission'}, next=lambda: passed.append(True))
+
+    assert passed == [True, True]
+    assert list(read_recording(str(path))) == [(100.0,
+                                                 {'type': 'event_callback'})]
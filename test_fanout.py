@@ -0,0 +1,37 @@
+import threading
+
+import fakeredis
+
+from fanout import DMFanout
+from slack_rate import RateLimiter
+
+
+class FlakyClient:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.messaged = []
+        self._lock = threading.Lock()
+
+    def chat_postMessage(self, channel, text):
+        if channel in self.failing:
+            raise RuntimeError('channel_not_found')
+        with self._lock:
+            self.messaged.append(channel)
+
+
+def test_rerun_resumes_without_duplicates():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    limiter = RateLimiter(rate_for=lambda method: 60000)
+    recipients = [f'U{number}' for number in range(30)]
+
+    client = FlakyClient(failing={'U3', 'U7'})
+    fanout = DMFanout(client, rds, 'reminders_sent:test', workers=4,
+                      limiter=limiter)
+    assert fanout.send(recipients, 'hello') == (28, 0, 2)
+
+    client = FlakyClient()
+    fanout = DMFanout(client, rds, 'reminders_sent:test', workers=4,
+                      limiter=limiter)
+    assert fanout.send(recipients, 'hello') == (2, 28, 0)
+    assert sorted(client.messaged) == ['U3', 'U7']
+    assert rds.ttl('reminders_sent:test') > 0
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import fakeredis
+
+import leaderboard
+from meta import USER_TOTALS_HASH, WEEKLY_USER_TOTALS_HASH
+
+
+def activity(user_name, points, week=23):
+    return SimpleNamespace(channel='wellness', challenge_year=2022,
+                           challenge_week=week, user_name=user_name,
+                           points=points)
+
+
+def test_standings():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    with rds.pipeline() as pipe:
+        for user_name, points, week in (('ann', 30, 23), ('bob', 20, 23),
+                                        ('bob', 60, 22), ('eve', 10, 23),
+                                        ('eve', -10, 23)):
+            leaderboard.queue_updates(pipe, activity(user_name, points, week))
+        pipe.execute()
+
+    weekly, all_time = leaderboard.standings(rds, 'wellness', 2022, 23,
+                                             'eve', count=2)
+
+    assert weekly == ([('ann', 30), ('bob', 20)], 3, 0)
+    assert all_time == ([('bob', 80), ('ann', 30)], 3, 0)
+
+    _, all_time = leaderboard.standings(rds, 'wellness', 2022, 23, 'zoe')
+    assert all_time[1:] == (None, 0)
+
+
+def test_rebuild_from_balances():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    rds.hset(USER_TOTALS_HASH, mapping={'wellness-ann': 30,
+                                        'wellness-bob.smith': 80,
+                                        'yoga-ann': 500})
+    rds.hset(WEEKLY_USER_TOTALS_HASH, mapping={'wellness-2022-23-ann': 30,
+                                               'wellness-2022-22-bob': 60})
+
+    assert leaderboard.rebuild(rds, 'wellness') == 2
+    assert leaderboard.rebuild(rds, 'wellness', 2022, 23) == 1
+
+    weekly, all_time = leaderboard.standings(rds, 'wellness', 2022, 23,
+                                             'ann')
+    assert weekly == ([('ann', 30)], 1, 30)
+    assert all_time == ([('bob.smith', 80), ('ann', 30)], 2, 30)
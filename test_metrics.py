@@ -0,0 +1,66 @@
+import urllib.request
+
+import fakeredis
+
+from metrics import Registry, start_http_server
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    for seconds in (0.0005, 0.003, 0.003, 20):
+        registry.observe('es_save_seconds', seconds)
+
+    text = registry.render()
+    assert '# TYPE es_save_seconds histogram' in text
+    assert 'es_save_seconds_bucket{le="0.001"} 1' in text
+    assert 'es_save_seconds_bucket{le="0.005"} 3' in text
+    assert 'es_save_seconds_bucket{le="10.0"} 3' in text
+    assert 'es_save_seconds_bucket{le="+Inf"} 4' in text
+    assert 'es_save_seconds_count 4' in text
+
+
+def test_counters_and_gauges_with_labels():
+    registry = Registry()
+    registry.inc('slack_requests_total', type='reaction_added')
+    registry.inc('slack_requests_total', type='reaction_added')
+    registry.inc('slack_requests_total', type='view_submission')
+    registry.gauge('slack_outbox_queue', lambda: 7)
+
+    text = registry.render()
+    assert 'slack_requests_total{type="reaction_added"} 2' in text
+    assert 'slack_requests_total{type="view_submission"} 1' in text
+    assert text.count('# TYPE slack_requests_total counter') == 1
+    assert 'slack_outbox_queue 7' in text
+
+
+def test_timed_records_calls():
+    registry = Registry()
+
+    @registry.timed('user_lookup_seconds')
+    def lookup(user_id):
+        return user_id.lower()
+
+    assert lookup('U1') == 'u1'
+    assert 'user_lookup_seconds_count 1' in registry.render()
+
+
+def test_publish_to_redis():
+    registry = Registry()
+    registry.inc('duplicate_events_total')
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    registry.publish(rds, 'wellness_metrics:host-1', ttl=180)
+    assert rds.hget('wellness_metrics:host-1', 'duplicate_events_total') == '1'
+    assert 0 < rds.ttl('wellness_metrics:host-1') <= 180
+
+
+def test_http_endpoint():
+    registry = Registry()
+    registry.inc('duplicate_events_total')
+    server = start_http_server(0, registry=registry, address='127.0.0.1')
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/metrics'
+        with urllib.request.urlopen(url) as response:
+            assert 'duplicate_events_total 1' in response.read().decode()
+    finally:
+        server.shutdown()
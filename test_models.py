@@ -0,0 +1,84 @@
+import datetime
+import os
+import subprocess
+import sys
+
+# the index name is read when the document class is defined
+os.environ.setdefault('WELLNESS_INDEX', 'wellness-test')
+
+import models  # noqa: E402
+
+# the name set by the environment when there is one
+INDEX = models.WELLNESS_INDEX
+
+IMPORT_SCRIPTS = '''
+import socket, sys
+
+def no_network(*args, **kwargs):
+    raise RuntimeError('network access while importing')
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+
+import models, report, nightly_check, daily_reminder, manage_indices
+
+assert 'app' not in sys.modules
+assert 'slack_bolt' not in sys.modules
+'''
+
+
+def test_scripts_import_without_the_bot():
+    env = dict(os.environ, SENTRY_TOKEN='', SLACK_BOT_TOKEN='xoxb-test',
+               SLACK_POST_CHANNEL='wellness', WELLNESS_INDEX='wellness-test')
+    env.pop('SLACK_APP_TOKEN', None)
+
+    subprocess.run([sys.executable, '-c', IMPORT_SCRIPTS], env=env,
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+
+def test_activity_hashes():
+    activity = models.WellnessActivity(channel='wellness-ukraine',
+                                       user_name='opikalo', challenge_year=2022,
+                                       challenge_week=23, challenge_day=3)
+
+    assert models.activity_hashes(activity) == (
+        'wellness-ukraine', 'wellness-ukraine-2022-23-3',
+        'wellness-ukraine-opikalo', 'wellness-ukraine-2022-23-opikalo')
+
+
+def test_partitions_between():
+    assert models.partitions_between(datetime.date(2022, 12, 28),
+                                     datetime.datetime(2023, 2, 1)) == [
+        f'{INDEX}-2022.12', f'{INDEX}-2023.01', f'{INDEX}-2023.02']
+    assert models.partitions_between(datetime.date(2022, 6, 5),
+                                     datetime.date(2022, 6, 11)) == [
+        f'{INDEX}-2022.06']
+
+
+def test_partitions_are_read_through_the_alias():
+    template = models.activity_template().to_dict()
+    assert template['index_patterns'] == [f'{INDEX}-*']
+    assert template['aliases'] == {INDEX: {}}
+
+    hit = {'_index': f'{INDEX}-2022.06', '_id': '1',
+           '_source': {'points': 20}}
+    assert models.WellnessActivity._matches(hit)
+
+
+def test_explicit_mapping():
+    mapping = models.activity_template().to_dict()['mappings']
+    assert mapping['dynamic'] is False
+    assert models.mapping_version({'mappings': mapping}) == \
+        models.MAPPING_VERSION
+    assert mapping['properties']['user_name'] == {'type': 'keyword'}
+    assert mapping['properties']['challenge_link']['index'] is False
+
+    assert models.mapping_version({'mappings': {'properties': {}}}) == 1
+
+
+def test_activity_search_filters():
+    search = models.activity_search(index=f'{INDEX}-2022.06',
+                                    channel_id='C1', deleted=False)
+    assert search._index == [f'{INDEX}-2022.06']
+    assert search.to_dict() == {'query': {'bool': {'filter': [
+        {'term': {'channel_id': 'C1'}}, {'term': {'deleted': False}}]}}}
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+from reaction_coalescer import ReactionCoalescer
+
+
+class ManualTimer:
+    # started timers only fire when the test calls fire()
+    def __init__(self, interval, function, args=()):
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def make_coalescer():
+    committed = []
+    timers = []
+
+    def timer(interval, function, args=()):
+        timers.append(ManualTimer(interval, function, args))
+        return timers[-1]
+
+    coalescer = ReactionCoalescer(5, lambda activity, payload:
+                                  committed.append((activity, payload)),
+                                  timer=timer)
+    return coalescer, committed, timers
+
+
+def activity(points):
+    return SimpleNamespace(points=points, deleted=points < 0)
+
+
+def fire(timer):
+    timer.function(*timer.args)
+
+
+def test_toggle_cancels_out():
+    coalescer, committed, timers = make_coalescer()
+    key = ('U1', 'C1', '1656000000.000100', 'walking')
+
+    coalescer.add(key, activity(10), 'added')
+    coalescer.add(key, activity(-10), 'removed')
+    assert len(timers) == 1
+
+    fire(timers[0])
+    assert committed == []
+    assert len(coalescer) == 0
+
+
+def test_net_change_is_committed_once():
+    coalescer, committed, timers = make_coalescer()
+    key = ('U1', 'C1', '1656000000.000100', 'walking')
+
+    for points, payload in [(10, 'a1'), (-10, 'r1'), (10, 'a2')]:
+        coalescer.add(key, activity(points), payload)
+
+    fire(timers[0])
+    [(net, payload)] = committed
+    assert (net.points, net.deleted, payload) == (10, False, 'a2')
+
+
+def test_net_removal_keeps_removed_activity():
+    coalescer, committed, timers = make_coalescer()
+    key = ('U1', 'C1', '1656000000.000100', 'walking')
+
+    coalescer.add(key, activity(-10), 'r1')
+    coalescer.add(key, activity(10), 'a1')
+    coalescer.add(key, activity(-10), 'r2')
+
+    coalescer.close()
+    [(net, payload)] = committed
+    assert (net.points, net.deleted, payload) == (-10, True, 'r2')
+    assert timers[0].cancelled
+
+
+def test_keys_are_committed_separately():
+    coalescer, committed, timers = make_coalescer()
+
+    coalescer.add(('U1', 'C1', '1', 'walking'), activity(10), 'u1')
+    coalescer.add(('U2', 'C1', '1', 'walking'), activity(10), 'u2')
+    assert len(timers) == 2
+
+    for timer in timers:
+        fire(timer)
+    assert [payload for _, payload in committed] == ['u1', 'u2']
+
+
+def test_failed_commit_is_reported_with_every_folded_reaction():
+    failed = []
+
+    def commit(activity, payload):
+        raise ConnectionError('redis is down')
+
+    timers = []
+
+    def timer(interval, function, args=()):
+        timers.append(ManualTimer(interval, function, args))
+        return timers[-1]
+
+    coalescer = ReactionCoalescer(5, commit, timer=timer,
+                                  on_failure=lambda activity, items:
+                                  failed.append((activity, items)))
+    key = ('U1', 'C1', '1656000000.000100', 'walking')
+    for points, payload in [(10, 'a1'), (-10, 'r1'), (10, 'a2')]:
+        coalescer.add(key, activity(points), payload)
+
+    fire(timers[0])
+    [(net, items)] = failed
+    assert net.points == 10
+    assert [payload for _, payload in items] == ['a1', 'r1', 'a2']
+    assert len(coalescer) == 0
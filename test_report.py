@@ -0,0 +1,67 @@
+import json
+import os
+
+from elasticsearch import Connection, Elasticsearch
+from elasticsearch_dsl.connections import connections
+
+# report.py reads its configuration when it is imported
+os.environ.setdefault('SENTRY_TOKEN', '')
+os.environ.setdefault('SLACK_BOT_TOKEN', 'xoxb-test')
+os.environ.setdefault('SLACK_POST_CHANNEL', 'wellness')
+os.environ.setdefault('WELLNESS_INDEX', 'wellness-test')
+
+import report  # noqa: E402
+
+
+def bucket(year, week, user_email, points):
+    return {'key': {'challenge_year': year, 'challenge_week': week,
+                    'user_email': user_email},
+            'doc_count': 1, 'points': {'value': float(points)}}
+
+
+# the composite aggregation answered in two pages, the last one short
+PAGES = [
+    [bucket(2022, 23, 'ann@example.com', 140),
+     bucket(2022, 23, 'bob@example.com', 60)],
+    [bucket(2022, 24, 'ann@example.com', 130)],
+]
+
+
+class PagesConnection(Connection):
+    requests = []
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        body = json.loads(body)
+        self.requests.append(body)
+
+        buckets = PAGES[len(self.requests) - 1]
+        weekly_users = {'buckets': buckets,
+                        'after_key': buckets[-1]['key']}
+        return 200, {}, json.dumps({
+            'took': 1, 'timed_out': False,
+            'hits': {'total': {'value': 0, 'relation': 'eq'}, 'hits': []},
+            'aggregations': {'weekly_users': weekly_users}})
+
+
+def test_weekly_user_points_follows_after_key(monkeypatch):
+    PagesConnection.requests = []
+    monkeypatch.setattr(connections, '_conns', {
+        'default': Elasticsearch(connection_class=PagesConnection)})
+
+    weekly_points = list(report.weekly_user_points('C1', page_size=2))
+
+    assert weekly_points == [(23, 2022, 'ann@example.com', 140),
+                             (23, 2022, 'bob@example.com', 60),
+                             (24, 2022, 'ann@example.com', 130)]
+
+    # the second page starts after the last bucket of the first one, the
+    # short second page is the last
+    first, second = PagesConnection.requests
+    assert 'after' not in first['aggs']['weekly_users']['composite']
+    assert second['aggs']['weekly_users']['composite']['after'] == \
+        PAGES[0][-1]['key']
+
+    totals, excess = report.summarize(weekly_points)
+    assert totals == {'23-2022': 160, '24-2022': 100}
+    assert excess == {'ann@example.com': 70}
@@ -0,0 +1,63 @@
+import fakeredis
+
+from slack_cache import LocalCache, TieredCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_cache_evicts_and_expires():
+    clock = FakeClock()
+    cache = LocalCache(maxsize=2, ttl=10, clock=clock)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+
+    clock.now = 11
+    assert cache.get('a') is None
+
+
+def test_tiered_cache_loads_once_per_tier():
+    server = fakeredis.FakeServer()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {'name': 'opikalo'}
+
+    def make_cache():
+        return TieredCache('user', ttl=60, redis_factory=lambda: fakeredis.FakeStrictRedis(server=server, decode_responses=True))
+
+    first = make_cache()
+    assert first.get('U1', loader) == {'name': 'opikalo'}
+    assert first.get('U1', loader) == {'name': 'opikalo'}
+
+    # another process finds the value in redis
+    second = make_cache()
+    assert second.get('U1', loader) == {'name': 'opikalo'}
+    assert len(loads) == 1
+
+    second.invalidate('U1')
+    assert make_cache().get('U1', loader) == {'name': 'opikalo'}
+    assert len(loads) == 2
+
+
+def test_set_many_warms_both_tiers():
+    server = fakeredis.FakeServer()
+    rds = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    cache = TieredCache('channel', ttl=60, redis_factory=lambda: rds)
+
+    cache.set_many({'C1': 'wellness', 'C2': 'general'})
+
+    assert cache.get('C2', loader=None) == 'general'
+    assert rds.get('channel:C1') == '"wellness"'
+    assert 0 < rds.ttl('channel:C1') <= 60
@@ -0,0 +1,78 @@
+import fakeredis
+
+import slack_directory
+from meta import SLACK_USERS_HASH
+
+
+class UsersClient:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = 0
+
+    def users_list(self, cursor=None, limit=200):
+        page = int(cursor or 0)
+        self.calls += 1
+        next_cursor = str(page + 1) if page + 1 < len(self.pages) else ''
+        return FakeResponse({'members': self.pages[page],
+                             'response_metadata': {'next_cursor': next_cursor}})
+
+
+class FakeResponse(dict):
+    @property
+    def data(self):
+        return self
+
+
+def user(user_id, name, is_bot=False):
+    return {'id': user_id, 'name': name, 'is_bot': is_bot}
+
+
+def test_reconcile_writes_only_changes():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    client = UsersClient([[user('U1', 'ann'), user('B1', 'bot', True)],
+                          [user('U2', 'bob')]])
+
+    assert slack_directory.user_names(rds, client) == {'U1': 'ann', 'U2': 'bob'}
+    assert client.calls == 2
+
+    # already synced, so the next read does not touch slack
+    assert slack_directory.user_names(rds, client) == {'U1': 'ann', 'U2': 'bob'}
+    assert client.calls == 2
+
+    client.pages = [[user('U1', 'ann'), user('U2', 'bobby')]]
+    assert slack_directory.reconcile_users(rds, client) == 1
+    assert rds.hget(SLACK_USERS_HASH, 'U2') == 'bobby'
+
+
+def test_events_keep_directory_current():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    slack_directory.store_user(rds, user('U3', 'carol'))
+    assert rds.hgetall(SLACK_USERS_HASH) == {'U3': 'carol'}
+
+    slack_directory.store_user(rds, user('U3', 'carol', is_bot=True))
+    assert rds.hgetall(SLACK_USERS_HASH) == {}
+
+
+class MembersClient:
+    def __init__(self, members):
+        self.members = members
+        self.calls = 0
+
+    def conversations_members(self, channel, cursor=None, limit=200):
+        self.calls += 1
+        return FakeResponse({'members': self.members,
+                             'response_metadata': {'next_cursor': ''}})
+
+
+def test_channel_members_backfilled_once_then_event_driven():
+    rds = fakeredis.FakeStrictRedis(decode_responses=True)
+    client = MembersClient(['U1', 'U2'])
+
+    assert slack_directory.channel_members(rds, 'C1', client) == {'U1', 'U2'}
+
+    slack_directory.add_member(rds, 'C1', 'U3')
+    slack_directory.remove_member(rds, 'C1', 'U1')
+
+    assert slack_directory.channel_members(rds, 'C1', client) == {'U2', 'U3'}
+    assert client.calls == 1
@@ -0,0 +1,81 @@
+import threading
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+
+from slack_outbox import SlackOutbox
+from slack_rate import RateLimiter, TokenBucket, retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def rate_limited(retry_after_seconds):
+    response = SlackResponse(client=None, http_verb='POST',
+                             api_url='chat.postMessage', req_args={},
+                             data={'ok': False, 'error': 'ratelimited'},
+                             headers={'Retry-After': str(retry_after_seconds)},
+                             status_code=429)
+    return SlackApiError('ratelimited', response)
+
+
+class RecordingClient:
+    def __init__(self, failures=0):
+        self.posted = []
+        self.failures = failures
+        self._lock = threading.Lock()
+
+    def chat_postMessage(self, **kwargs):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise rate_limited(0)
+            self.posted.append(kwargs)
+
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.5
+
+
+def test_token_bucket_pause():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock, sleep=clock.sleep)
+
+    bucket.pause(3)
+    bucket.acquire()
+    assert clock.now >= 3
+
+
+def test_retry_after():
+    assert retry_after(rate_limited(7)) == 7
+    assert retry_after(ValueError()) is None
+
+
+def test_outbox_keeps_channel_order_and_retries():
+    client = RecordingClient(failures=2)
+    outbox = SlackOutbox(client, workers=3,
+                         limiter=RateLimiter(rate_for=lambda method: 60000))
+
+    for number in range(20):
+        outbox.chat_postMessage(channel=f'C{number % 4}', text=str(number))
+    outbox.flush()
+    outbox.stop()
+
+    assert len(client.posted) == 20
+    for channel in ('C0', 'C1', 'C2', 'C3'):
+        texts = [int(message['text']) for message in client.posted
+                 if message['channel'] == channel]
+        assert texts == sorted(texts)
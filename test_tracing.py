@@ -0,0 +1,63 @@
+import inspect
+
+import pytest
+
+import tracing
+from tracing import AdaptiveSampler, parse_rates
+
+
+def context(name, parent_sampled=None):
+    return {'transaction_context': {'name': name, 'op': 'slack.handler'},
+            'parent_sampled': parent_sampled}
+
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rates_per_transaction():
+    sampler = AdaptiveSampler(0.05, parse_rates('reaction_added=0.01, view_edit=1'))
+
+    assert sampler(context('reaction_added')) == 0.01
+    assert sampler(context('view_edit')) == 1.0
+    assert sampler(context('open_add_modal')) == 0.05
+    assert sampler(context('reaction_added', parent_sampled=True)) is True
+
+
+def test_slow_or_failed_transactions_boost_sampling():
+    clock = Clock()
+    sampler = AdaptiveSampler(0.05, {'reaction_added': 0.01},
+                              slow_seconds=2, boost_seconds=300, clock=clock)
+
+    sampler.observe('reaction_added', 0.1)
+    assert sampler(context('reaction_added')) == 0.01
+
+    sampler.observe('reaction_added', 2.5)
+    assert sampler(context('reaction_added')) == 1.0
+    assert sampler(context('view_add')) == 0.05
+
+    clock.now += 301
+    assert sampler(context('reaction_added')) == 0.01
+
+    sampler.observe('view_add', 0.1, failed=True)
+    assert sampler(context('view_add')) == 1.0
+
+
+def test_transaction_keeps_listener_arguments(monkeypatch):
+    sampler = AdaptiveSampler(0.05, boost_seconds=300)
+    monkeypatch.setattr(tracing, 'sampler', sampler)
+
+    @tracing.transaction('view_add')
+    def handle_add_events(ack, body, logger):
+        raise ValueError(body)
+
+    # bolt passes the listener arguments by name
+    assert inspect.getfullargspec(handle_add_events).args == ['ack', 'body',
+                                                              'logger']
+
+    with pytest.raises(ValueError):
+        handle_add_events(None, {}, None)
+    assert sampler(context('view_add')) == 1.0
@@ -0,0 +1,63 @@
+import threading
+
+import fakeredis
+import pytest
+import redis
+
+import wellness_redis
+from wellness_redis import InstrumentedConnectionPool
+
+
+@pytest.fixture
+def pool():
+    pool = InstrumentedConnectionPool(
+        connection_class=fakeredis.FakeConnection,
+        server=fakeredis.FakeServer(), max_connections=1, timeout=0.01,
+        decode_responses=True)
+    wellness_redis.set_pool(pool)
+    yield pool
+    wellness_redis.set_pool(None)
+
+
+def test_clients_share_pool(pool):
+    first = wellness_redis.get_redis()
+    second = wellness_redis.get_redis()
+    assert first.connection_pool is second.connection_pool is pool
+
+    first.set('key', 1)
+    assert second.get('key') == '1'
+
+    stats = wellness_redis.pool_stats()
+    assert stats['checkouts'] == 2
+    assert stats['connects'] == 1
+    assert stats['created'] == 1
+    assert stats['in_use'] == 0
+
+
+def test_exhausted_pool_counts_waits_and_errors(pool):
+    connection = pool.get_connection('PING')
+
+    with pytest.raises(redis.ConnectionError):
+        wellness_redis.get_redis().ping()
+
+    pool.release(connection)
+    stats = pool.usage()
+    assert stats['waits'] == 1
+    assert stats['errors'] == 1
+
+
+def test_pool_is_built_once():
+    wellness_redis.set_pool(None)
+    pools = []
+
+    def build():
+        pools.append(wellness_redis.get_pool())
+
+    threads = [threading.Thread(target=build) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, pools))) == 1
+    wellness_redis.set_pool(None)
@@ -0,0 +1,108 @@
+import functools
+import inspect
+import os
+import threading
+import time
+
+import sentry_sdk
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# share of the transactions traced when nothing below says otherwise
+SENTRY_TRACES_SAMPLE_RATE = float(os.environ.get('SENTRY_TRACES_SAMPLE_RATE',
+                                                 '0.05'))
+
+# per transaction rates, like "reaction_added=0.01,view_edit=1"
+SENTRY_TRACES_RATES = os.environ.get('SENTRY_TRACES_RATES',
+                                     'reaction_added=0.01')
+
+# a transaction failing or running longer than this many seconds has all
+# transactions of the same name traced for SENTRY_TRACES_BOOST seconds
+SENTRY_SLOW_SECONDS = float(os.environ.get('SENTRY_SLOW_SECONDS', '2'))
+SENTRY_TRACES_BOOST = float(os.environ.get('SENTRY_TRACES_BOOST', '300'))
+
+
+def parse_rates(rates):
+    # "reaction_added=0.01,view_add=0.5" -> {'reaction_added': 0.01, ...}
+    parsed = {}
+    for rate in rates.split(','):
+        if not rate.strip():
+            continue
+        name, value = rate.split('=')
+        parsed[name.strip()] = float(value)
+    return parsed
+
+
+class AdaptiveSampler:
+    # Sentry traces_sampler. Healthy traffic is traced at a low per
+    # transaction rate, but once a transaction fails or is slow every
+    # transaction with its name is traced for a while, so the traces around
+    # an incident are complete. Sentry decides when a transaction starts,
+    # so the transaction that fails or is slow is only traced if it was
+    # sampled; the error event itself is always sent.
+
+    def __init__(self, base_rate, rates=None, slow_seconds=2.0,
+                 boost_seconds=300.0, clock=time.monotonic):
+        self.base_rate = base_rate
+        self.rates = rates or {}
+        self.slow_seconds = slow_seconds
+        self.boost_seconds = boost_seconds
+        self._clock = clock
+        self._boosted = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, sampling_context):
+        # keep the decision of a distributed parent
+        parent_sampled = sampling_context.get('parent_sampled')
+        if parent_sampled is not None:
+            return parent_sampled
+
+        name = sampling_context['transaction_context'].get('name')
+        with self._lock:
+            boosted_until = self._boosted.get(name)
+        if boosted_until is not None and boosted_until > self._clock():
+            return 1.0
+
+        return self.rates.get(name, self.base_rate)
+
+    def observe(self, name, seconds, failed=False):
+        if failed or seconds >= self.slow_seconds:
+            with self._lock:
+                self._boosted[name] = self._clock() + self.boost_seconds
+
+
+sampler = AdaptiveSampler(SENTRY_TRACES_SAMPLE_RATE,
+                          parse_rates(SENTRY_TRACES_RATES),
+                          slow_seconds=SENTRY_SLOW_SECONDS,
+                          boost_seconds=SENTRY_TRACES_BOOST)
+
+
+def init_sentry(**kwargs):
+    sentry_sdk.init(dsn=os.environ['SENTRY_TOKEN'], traces_sampler=sampler,
+                    **kwargs)
+
+
+def transaction(name, op='slack.handler'):
+    # Runs the decorated function in a sentry transaction and reports its
+    # duration and failures to the sampler. Bolt picks the arguments of a
+    # listener by their names (with inspect.getfullargspec, which ignores
+    # __wrapped__), so the wrapper carries the signature of the listener.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            with sentry_sdk.start_transaction(op=op, name=name):
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    sampler.observe(name, time.perf_counter() - start, failed)
+
+        wrapper.__signature__ = inspect.signature(func)
+        return wrapper
+    return decorator
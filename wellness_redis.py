@@ -1,7 +1,9 @@
 import logging
 import os
+import threading
 
 import redis
+import redis.asyncio
 
 from dotenv import load_dotenv
 
@@ -11,7 +13,122 @@ REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.environ.get('REDIS_PORT', '6379'))
 REDIS_DB = int(os.environ.get('REDIS_DB', '0'))
 
+# one pool is shared by all Bolt listener threads of the process, so size it
+# at least as large as the listener thread pool (SLACK_LISTENER_WORKERS)
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', '20'))
+# seconds to wait for a free connection before giving up
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', '5'))
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_async_pool = None
+
+
+class PoolStats:
+    counters = ('checkouts', 'waits', 'connects', 'errors')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(self.counters, 0)
+
+    def incr(self, counter):
+        with self._lock:
+            self._values[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """Blocking connection pool which counts checkouts, waits for a free
+    connection, (re)connects and connection errors."""
+
+    def __init__(self, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(**kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        connection.register_connect_callback(self._on_connect)
+        return connection
+
+    def _on_connect(self, connection):
+        self.stats.incr('connects')
+
+    def get_connection(self, command_name, *keys, **options):
+        self.stats.incr('checkouts')
+
+        # every slot (including the not yet connected ones) is checked out,
+        # so this caller is going to block until somebody releases one
+        if self.pool.empty():
+            self.stats.incr('waits')
+
+        try:
+            return super().get_connection(command_name, *keys, **options)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.stats.incr('errors')
+            raise
+
+    def usage(self):
+        stats = self.stats.snapshot()
+        stats['max_connections'] = self.max_connections
+        stats['created'] = len(self._connections)
+        stats['in_use'] = self.max_connections - self.pool.qsize()
+        return stats
+
+
+def get_pool():
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                logger.info('creating redis pool of %s connections to %s:%s/%s',
+                            REDIS_MAX_CONNECTIONS, REDIS_HOST, REDIS_PORT,
+                            REDIS_DB)
+                _pool = InstrumentedConnectionPool(
+                    host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    timeout=REDIS_POOL_TIMEOUT,
+                    decode_responses=True)
+    return _pool
+
+
+def set_pool(pool):
+    # lets tests and benchmarks point every client at a stand-in server
+    global _pool
+
+    with _pool_lock:
+        _pool = pool
+
+
+def set_async_pool(pool):
+    # set_pool for get_async_redis
+    global _async_pool
+
+    _async_pool = pool
+
+
+def pool_stats():
+    return get_pool().usage()
+
 
 def get_redis():
-    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
-                       decode_responses=True)
+    return redis.Redis(connection_pool=get_pool())
+
+
+def get_async_redis():
+    # the asyncio bot runs a single event loop, so no locking is needed here
+    global _async_pool
+
+    if _async_pool is None:
+        _async_pool = redis.asyncio.BlockingConnectionPool(
+            host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            decode_responses=True)
+    return redis.asyncio.Redis(connection_pool=_async_pool)